@@ -0,0 +1,98 @@
+from enum import Enum
+import numpy as np
+
+
+class AccumulationMode(Enum):
+    Off = "OFF"
+    # N acquisitions, then the accumulation is complete
+    Average = "AVERAGE"
+    # Starts over every N acquisitions
+    Restart = "RESTART"
+    # Past N acquisitions each new one weighs 1/N, older ones fade out
+    Decay = "DECAY"
+
+
+PERSISTENCE_BINS = 256
+
+# The decayed persistence is stored divided by a shrinking scale, renormalized before it underflows
+PERSISTENCE_MIN_SCALE = 1e-100
+
+
+class WaveformAccumulator:
+    # Running statistics of waveforms of one length, every buffer is allocated once whatever the number of waveforms added
+    def __init__(self, points, y_min, y_max, bins=PERSISTENCE_BINS):
+        self.points = points
+        self.y_min = y_min
+        self.y_max = y_max
+        self.bins = bins
+
+        self.mean = np.zeros(points)
+        self.variance = np.zeros(points)
+        self.minimum = np.zeros(points)
+        self.maximum = np.zeros(points)
+
+        self._persistence = np.zeros((bins, points))
+        self._scale = 1.0
+        self._columns = np.arange(points)
+        self._delta = np.zeros(points)
+        self._work = np.zeros(points)
+
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+
+        self.mean.fill(0.0)
+        self.variance.fill(0.0)
+        self.minimum.fill(np.inf)
+        self.maximum.fill(-np.inf)
+
+        self._persistence.fill(0.0)
+        self._scale = 1.0
+
+    def add(self, volts, limit=None):
+        # Welford update with weight 1/count, or 1/limit once count is past it (exponential decay)
+        self.count = self.count + 1
+
+        weight = 1 / (self.count if limit is None else min(self.count, limit))
+        decaying = limit is not None and self.count > limit
+
+        np.subtract(volts, self.mean, out=self._delta)
+        self.mean += weight * self._delta
+
+        # variance = (1 - w) * (variance + w * delta^2), the population variance for w = 1/count
+        np.multiply(self._delta, self._delta, out=self._work)
+        self._work *= weight
+        self.variance += self._work
+        self.variance *= 1 - weight
+
+        if decaying:
+            # The envelope relaxes towards the mean as fast as the old acquisitions fade
+            for extreme, select in ((self.maximum, np.maximum), (self.minimum, np.minimum)):
+                np.subtract(extreme, self.mean, out=self._work)
+                self._work *= 1 - weight
+                self._work += self.mean
+                select(self._work, volts, out=extreme)
+
+            self._scale = self._scale * (1 - weight)
+        else:
+            np.maximum(self.maximum, volts, out=self.maximum)
+            np.minimum(self.minimum, volts, out=self.minimum)
+
+        rows = ((np.asarray(volts) - self.y_min) * (self.bins / (self.y_max - self.y_min))).astype(np.intp)
+        np.clip(rows, 0, self.bins - 1, out=rows)
+
+        # One bin per column, so no index repeats
+        self._persistence[rows, self._columns] += 1 / self._scale
+
+        if self._scale < PERSISTENCE_MIN_SCALE:
+            self._persistence *= self._scale
+            self._scale = 1.0
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def persistence(self):
+        # (bins, points) hits per voltage bin from y_min up, decayed like the mean
+        return self._persistence * self._scale
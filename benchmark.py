@@ -0,0 +1,113 @@
+import time
+import argparse
+import numpy as np
+import oscilloscope
+from oscilloscope import OscilloscopeChannel, OscilloscopeEncoding, OscilloscopeMeasurementType
+from tek_simulator import TekSimulator
+
+
+def TimeCalls(count, function, *args):
+    samples = np.empty(count)
+
+    for i in range(count):
+        start = time.perf_counter()
+        function(*args)
+        samples[i] = time.perf_counter() - start
+
+    return samples
+
+
+def RunBenchmark(ser, count):
+    results = {}
+
+    results["ID?"] = TimeCalls(count, oscilloscope.OscilloscopeSendCommandAndRead, ser, "ID?")
+
+    oscilloscope.OscilloscopeSetSetting(ser, "MEASU:IMM:SOU", OscilloscopeChannel.CH1.value)
+    oscilloscope.OscilloscopeSetSetting(ser, "MEASU:IMM:TYPE", OscilloscopeMeasurementType.PeakToPeak.value)
+    results["MEASU:IMM:VAL?"] = TimeCalls(count, oscilloscope.OscilloscopeSendCommandAndRead, ser, "MEASU:IMM:VAL?")
+
+    results["WFMPre?"] = TimeCalls(count, oscilloscope.OscilloscopeSendCommandAndRead, ser, "WFMPre?")
+
+    for encoding, width in [(OscilloscopeEncoding.ASCII, 2), (OscilloscopeEncoding.RIBinary, 1), (OscilloscopeEncoding.RIBinary, 2)]:
+        oscilloscope.OscilloscopeSetSetting(ser, "DAT:ENC", encoding.value)
+        oscilloscope.OscilloscopeSetSetting(ser, "DAT:WID", width)
+
+        if encoding == OscilloscopeEncoding.ASCII:
+            results[f"CURV? {encoding.name}/{width}"] = TimeCalls(count, oscilloscope.OscilloscopeSendCommandAndRead, ser, "CURV?")
+        else:
+            results[f"CURV? {encoding.name}/{width}"] = TimeCalls(count, oscilloscope.OscilloscopeSendCommandAndReadBlock, ser, "CURV?")
+
+    measurements = [(channel, type) for channel in OscilloscopeChannel for type in OscilloscopeMeasurementType]
+
+    results["Immediate measure"] = TimeCalls(count, oscilloscope.OscilloscopeImmediateMeasure, ser, OscilloscopeChannel.CH1, OscilloscopeMeasurementType.Frequency)
+    results[f"Measurement table ({len(measurements)})"] = TimeCalls(count, oscilloscope.OscilloscopeMeasureTable, ser, measurements)
+
+    for encoding, width in [(OscilloscopeEncoding.ASCII, 2), (OscilloscopeEncoding.RIBinary, 2)]:
+        results[f"Curve CH1 {encoding.name}/{width}"] = TimeCalls(count, oscilloscope.OscilloscopeCurves, ser, [OscilloscopeChannel.CH1], encoding, width)
+        results[f"Curve CH1+CH2 {encoding.name}/{width}"] = TimeCalls(count, oscilloscope.OscilloscopeCurves, ser, [OscilloscopeChannel.CH1, OscilloscopeChannel.CH2], encoding, width)
+        # The same frame without overlapping the decoding of CH1 with the transfer of CH2
+        results[f"Curve CH1+CH2 {encoding.name}/{width} seq."] = TimeCalls(count, lambda: [oscilloscope.OscilloscopeCurveRaw(ser, channel, encoding, width) for channel in [OscilloscopeChannel.CH1, OscilloscopeChannel.CH2]])
+        results[f"Curve CH1+CH2 {encoding.name}/{width} xfer"] = TimeCalls(count, lambda: [oscilloscope.OscilloscopeCurveTransfer(ser, channel, encoding, width) for channel in [OscilloscopeChannel.CH1, OscilloscopeChannel.CH2]])
+        # A zoomed in window only transfers its own points
+        results[f"Curve CH1+CH2 {encoding.name}/{width} 1/10"] = TimeCalls(count, oscilloscope.OscilloscopeCurves, ser, [OscilloscopeChannel.CH1, OscilloscopeChannel.CH2], encoding, width, 1001, 1250)
+
+    return results
+
+
+def RunParallelBenchmark(sessions, count):
+    # Capturing from every instrument at once should take as long as the slowest one, not the sum
+    results = {}
+    channels = [OscilloscopeChannel.CH1, OscilloscopeChannel.CH2]
+
+    workers = [oscilloscope.OscilloscopeWorker(ser) for ser in sessions]
+    for worker in workers:
+        worker.start()
+
+    try:
+        results[f"CH1+CH2 from 1 instrument"] = TimeCalls(count, oscilloscope.OscilloscopeCurvesRaw, sessions[0], channels)
+        results[f"CH1+CH2 from {len(sessions)}, one by one"] = TimeCalls(count, lambda: [oscilloscope.OscilloscopeCurvesRaw(ser, channels) for ser in sessions])
+        results[f"CH1+CH2 from {len(sessions)}, parallel"] = TimeCalls(count, oscilloscope.OscilloscopeCurvesParallel, workers, channels)
+    finally:
+        for worker in workers:
+            worker.stop()
+
+    return results
+
+
+def PrintReport(results):
+    print(f"{'Operation':<32}{'ops/s':>10}{'median [ms]':>14}{'p99 [ms]':>12}")
+
+    for name, samples in results.items():
+        print(f"{name:<32}{1 / samples.mean():>10.1f}{np.median(samples) * 1e3:>14.3f}{np.percentile(samples, 99) * 1e3:>12.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Driver throughput and latency benchmark")
+    parser.add_argument("--port", action="append", help="Benchmark a real device instead of the simulator, e.g. /dev/usbtmc0, repeat for several")
+    parser.add_argument("--instruments", type=int, default=1, help="Number of simulators, more than one also times parallel captures")
+    parser.add_argument("--count", type=int, default=200, help="Repetitions per operation")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated response latency [s]")
+    parser.add_argument("--rate", type=float, default=None, help="Simulated transfer rate [bytes/s]")
+    args = parser.parse_args()
+
+    simulators = []
+    ports = args.port
+    if ports is None:
+        simulators = [TekSimulator(latency=args.latency, transfer_rate=args.rate) for i in range(args.instruments)]
+        ports = [simulator.start() for simulator in simulators]
+
+    sessions = [oscilloscope.OscilloscopeSession(port) for port in ports]
+    for ser in sessions:
+        ser.open()
+
+    try:
+        results = RunBenchmark(sessions[0], args.count)
+        if len(sessions) > 1:
+            results.update(RunParallelBenchmark(sessions, args.count))
+
+        PrintReport(results)
+    finally:
+        for ser in sessions:
+            ser.close()
+        for simulator in simulators:
+            simulator.stop()
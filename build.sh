@@ -1,3 +1,4 @@
 #!/bin/bash
 
-pyinstaller --onefile --add-data "oscilloscope.jpg:." tek232.py
\ No newline at end of file
+pyinstaller --onefile --add-data "oscilloscope.jpg:." tek232.py
+pyinstaller --onefile --name tek232-cli tek232_cli.py
\ No newline at end of file
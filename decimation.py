@@ -0,0 +1,45 @@
+import numpy as np
+
+
+class DecimationPyramid:
+    # Min/max envelopes of y over bins of 2, 4, 8, ... samples of x (which must be increasing)
+    def __init__(self, x, y):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+
+        self.levels = []
+
+        minimum = self.y
+        maximum = self.y
+        while len(minimum) > 1:
+            if len(minimum) % 2:
+                minimum = np.append(minimum, minimum[-1])
+                maximum = np.append(maximum, maximum[-1])
+
+            minimum = np.minimum(minimum[0::2], minimum[1::2])
+            maximum = np.maximum(maximum[0::2], maximum[1::2])
+            self.levels.append((minimum, maximum))
+
+    def __len__(self):
+        return len(self.x)
+
+    def envelope(self, x_min, x_max, pixels):
+        # At most ~2 points per pixel of the visible range, every peak stays visible
+        start = max(int(np.searchsorted(self.x, x_min, side="right")) - 1, 0)
+        stop = min(int(np.searchsorted(self.x, x_max, side="left")) + 1, len(self.x))
+
+        count = stop - start
+        if count <= 2 * pixels:
+            return self.x[start:stop], self.y[start:stop]
+
+        level = min(int(np.ceil(np.log2(count / pixels))), len(self.levels)) - 1
+        bin_size = 2 ** (level + 1)
+
+        minimum, maximum = self.levels[level]
+        first = start // bin_size
+        last = min(-(-stop // bin_size), len(minimum))
+
+        x = self.x[np.minimum(np.arange(first, last) * bin_size, len(self.x) - 1)]
+
+        # Each bin is drawn as a vertical segment from its minimum to its maximum
+        return np.repeat(x, 2), np.column_stack([minimum[first:last], maximum[first:last]]).ravel()
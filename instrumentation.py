@@ -0,0 +1,187 @@
+import csv
+import math
+import time
+import threading
+import numpy as np
+
+
+# Latency histograms cover 1 us to 100 s in logarithmic bins, about 7.5 % wide
+LATENCY_HISTOGRAM_MIN = 1e-6
+LATENCY_HISTOGRAM_DECADES = 8
+LATENCY_HISTOGRAM_BINS_PER_DECADE = 32
+
+# Raw timings kept for export, the oldest are overwritten first
+COMMAND_TIMINGS_CAPACITY = 100000
+
+COMMAND_TIMING_DTYPE = np.dtype([
+    ("timestamp", np.float64),
+    ("command", np.int32),
+    ("send", np.float64),
+    ("first_byte", np.float64),
+    ("read", np.float64),
+    ("sent_bytes", np.int64),
+    ("received_bytes", np.int64),
+    ("parse", np.float64),
+])
+
+
+def CommandKey(message):
+    # Arguments are dropped so every "DAT:SOU CH1" and "DAT:SOU CH2" end up together
+    return ";".join(command.strip().split(" ")[0].upper() for command in message.split(";"))
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = np.zeros(LATENCY_HISTOGRAM_DECADES * LATENCY_HISTOGRAM_BINS_PER_DECADE + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        if seconds != seconds:
+            return
+
+        if seconds <= LATENCY_HISTOGRAM_MIN:
+            index = 0
+        else:
+            index = min(int(math.log10(seconds / LATENCY_HISTOGRAM_MIN) * LATENCY_HISTOGRAM_BINS_PER_DECADE), len(self.counts) - 1)
+
+        self.counts[index] += 1
+        self.count = self.count + 1
+        self.total = self.total + seconds
+
+    def percentile(self, q):
+        # Geometric center of the bin holding the q-th percentile
+        if self.count == 0:
+            return math.nan
+
+        index = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.count, side="left"))
+
+        return LATENCY_HISTOGRAM_MIN * 10 ** ((index + 0.5) / LATENCY_HISTOGRAM_BINS_PER_DECADE)
+
+    def mean(self):
+        return self.total / self.count if self.count else math.nan
+
+
+class CommandStats:
+    def __init__(self, key):
+        self.key = key
+
+        self.send = LatencyHistogram()
+        self.first_byte = LatencyHistogram()
+        self.read = LatencyHistogram()
+        self.total = LatencyHistogram()
+        self.parse = LatencyHistogram()
+
+        self.calls = 0
+        self.sent_bytes = 0
+        self.received_bytes = 0
+
+
+class CommandProfiler:
+    # Per command timings reported by the driver while it's set as OscilloscopeSession.profiler
+    def __init__(self, capacity=COMMAND_TIMINGS_CAPACITY):
+        self.lock = threading.Lock()
+
+        self.stats = {}
+        self.timings = np.zeros(capacity, dtype=COMMAND_TIMING_DTYPE)
+        self.recorded = 0
+        self.started = time.monotonic()
+
+        self._keys = []
+        self._key_indices = {}
+        # Slot and stats of the last command recorded by each thread, every session is used by one thread
+        self._last = threading.local()
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.recorded = 0
+            self.started = time.monotonic()
+
+    def record(self, message, send, first_byte=math.nan, read=math.nan, received_bytes=0):
+        key = CommandKey(message)
+
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = CommandStats(key)
+
+            if key not in self._key_indices:
+                self._key_indices[key] = len(self._keys)
+                self._keys.append(key)
+
+            stats.send.add(send)
+            stats.first_byte.add(first_byte)
+            stats.read.add(read)
+            stats.total.add(send if read != read else send + read)
+            stats.calls = stats.calls + 1
+            stats.sent_bytes = stats.sent_bytes + len(message) + 1
+            stats.received_bytes = stats.received_bytes + received_bytes
+
+            slot = self.recorded % len(self.timings)
+            self.timings[slot] = (time.time(), self._key_indices[key], send, first_byte, read, len(message) + 1, received_bytes, math.nan)
+            self.recorded = self.recorded + 1
+
+            self._last.record = (self.recorded, stats)
+
+    def parsed(self, seconds, message=None):
+        # Parse time of the response to the last command recorded by this thread, or of one of the earlier responses to message
+        with self.lock:
+            if message is not None:
+                stats = self.stats.get(CommandKey(message))
+                if stats is not None:
+                    stats.parse.add(seconds)
+                return
+
+            recorded, stats = getattr(self._last, "record", (0, None))
+
+            # Nothing recorded since the last reset
+            if stats is None or self.stats.get(stats.key) is not stats:
+                return
+
+            if self.recorded - recorded < len(self.timings):
+                self.timings["parse"][(recorded - 1) % len(self.timings)] = seconds
+            stats.parse.add(seconds)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def raw(self):
+        # Recorded timings oldest first and the command names their "command" field indexes
+        with self.lock:
+            count = min(self.recorded, len(self.timings))
+            slots = np.arange(self.recorded - count, self.recorded) % len(self.timings)
+
+            return self.timings[slots], list(self._keys)
+
+    def export_csv(self, path):
+        timings, keys = self.raw()
+
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["timestamp", "command", "send [s]", "first byte [s]", "read [s]", "sent [bytes]", "received [bytes]", "parse [s]"])
+
+            for timing in timings:
+                writer.writerow([f"{timing['timestamp']:.6f}", keys[timing["command"]], f"{timing['send']:.9f}", f"{timing['first_byte']:.9f}", f"{timing['read']:.9f}", timing["sent_bytes"], timing["received_bytes"], f"{timing['parse']:.9f}"])
+
+    def report(self):
+        # One row per command: key, calls, calls/s, received bytes/s over the read time, and latency percentiles [s]
+        elapsed = self.elapsed()
+        rows = []
+
+        with self.lock:
+            for stats in sorted(self.stats.values(), key=lambda stats: -stats.total.total):
+                rows.append({
+                    "command": stats.key,
+                    "calls": stats.calls,
+                    "rate": stats.calls / elapsed if elapsed > 0 else math.nan,
+                    "throughput": stats.received_bytes / stats.read.total if stats.read.total > 0 else math.nan,
+                    "first_byte_p50": stats.first_byte.percentile(50),
+                    "total_p50": stats.total.percentile(50),
+                    "total_p90": stats.total.percentile(90),
+                    "total_p99": stats.total.percentile(99),
+                    "parse_p50": stats.parse.percentile(50),
+                    "time": stats.total.total + stats.parse.total,
+                })
+
+        return rows
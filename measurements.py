@@ -0,0 +1,182 @@
+from enum import Enum
+import numpy as np
+
+
+class HostMeasurementType(Enum):
+    PeakToPeak = "PK2PK"
+    Frequency = "FREQ"
+    Period = "PERI"
+    Maximum = "MAXI"
+    Minimum = "MINI"
+    Mean = "MEAN"
+    RMS = "RMS"
+    RiseTime = "RISE"
+    FallTime = "FALL"
+    DutyCycle = "PDUTY"
+    Crossings = "CROSS"
+
+HOST_MEASUREMENT_UNITS = {
+    HostMeasurementType.PeakToPeak: "V",
+    HostMeasurementType.Frequency: "Hz",
+    HostMeasurementType.Period: "s",
+    HostMeasurementType.Maximum: "V",
+    HostMeasurementType.Minimum: "V",
+    HostMeasurementType.Mean: "V",
+    HostMeasurementType.RMS: "V",
+    HostMeasurementType.RiseTime: "s",
+    HostMeasurementType.FallTime: "s",
+    HostMeasurementType.DutyCycle: "%",
+    HostMeasurementType.Crossings: "",
+}
+
+# Edges are detected with this much hysteresis around the reference level, as a fraction of the amplitude
+EDGE_HYSTERESIS = 0.1
+
+
+def _HysteresisState(volts, low, high):
+    # +1 above high, -1 below low, in between the last state is held (0 before the first threshold)
+    state = np.where(volts > high, 1, np.where(volts < low, -1, 0)).astype(np.int8)
+
+    positions = np.where(state != 0, np.arange(volts.shape[-1]), 0)
+    np.maximum.accumulate(positions, axis=-1, out=positions)
+
+    return np.take_along_axis(state, positions, axis=-1), state
+
+
+def _CrossingTime(time, volts, index, level):
+    # Linear interpolation of the crossing of level between samples index - 1 and index
+    index = np.clip(index, 1, volts.shape[-1] - 1)
+
+    v0 = np.take_along_axis(volts, (index - 1)[:, None], axis=-1)[:, 0]
+    v1 = np.take_along_axis(volts, index[:, None], axis=-1)[:, 0]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(v1 != v0, (level - v0) / (v1 - v0), 0.0)
+
+    return time[index - 1] + fraction * (time[index] - time[index - 1])
+
+
+def _FirstIndex(mask):
+    # Index of the first True along the last axis, -1 where there is none
+    return np.where(mask.any(axis=-1), mask.argmax(axis=-1), -1)
+
+
+def _LastIndex(mask):
+    return np.where(mask.any(axis=-1), mask.shape[-1] - 1 - mask[:, ::-1].argmax(axis=-1), -1)
+
+
+def _Edges(volts, low, high, rising):
+    # Rising (or falling) transitions through the hysteresis band, and when the high (or low) level was crossed
+    filled, raw = _HysteresisState(volts, low[:, None], high[:, None])
+
+    before, after = (-1, 1) if rising else (1, -1)
+    transitions = np.zeros(volts.shape, dtype=bool)
+    transitions[:, 1:] = (filled[:, :-1] == before) & (filled[:, 1:] == after)
+
+    return transitions, filled, raw
+
+
+def _TransitionTime(time, volts, index, level):
+    valid = index >= 0
+    result = np.full(len(index), np.nan)
+
+    if valid.any():
+        result[valid] = _CrossingTime(time, volts[valid], index[valid], level[valid])
+
+    return result
+
+
+def MeasureWaveforms(time, volts, types):
+    # volts is (..., points) sampled at time (points,), every result has the leading shape of volts
+    volts = np.asarray(volts, dtype=np.float64)
+    time = np.asarray(time, dtype=np.float64)
+
+    shape = volts.shape[:-1]
+    volts = volts.reshape(-1, volts.shape[-1])
+
+    maximum = volts.max(axis=-1)
+    minimum = volts.min(axis=-1)
+    amplitude = maximum - minimum
+    middle = (maximum + minimum) / 2
+
+    results = {}
+    edges = None
+
+    def edges_at_middle():
+        nonlocal edges
+        if edges is None:
+            edges = _Edges(volts, middle - EDGE_HYSTERESIS * amplitude, middle + EDGE_HYSTERESIS * amplitude, rising=True)
+        return edges
+
+    def period():
+        transitions, _, _ = edges_at_middle()
+
+        count = transitions.sum(axis=-1)
+        first = _FirstIndex(transitions)
+        last = _LastIndex(transitions)
+        level = middle + EDGE_HYSTERESIS * amplitude
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(count >= 2, (_TransitionTime(time, volts, last, level) - _TransitionTime(time, volts, first, level)) / (count - 1), np.nan)
+
+    def transition_time(rising):
+        low = minimum + 0.1 * amplitude
+        high = maximum - 0.1 * amplitude
+
+        transitions, _, raw = _Edges(volts, low, high, rising)
+        end = _FirstIndex(transitions)
+
+        # The edge starts where the signal last left the opposite band before reaching the end level
+        outside = raw == (-1 if rising else 1)
+        outside = outside & (np.arange(volts.shape[-1]) < end[:, None])
+        start = _LastIndex(outside) + 1
+
+        valid = (end >= 0) & (start > 0)
+        start_level = low if rising else high
+        end_level = high if rising else low
+
+        return np.where(valid, _TransitionTime(time, volts, np.where(valid, end, -1), end_level) - _TransitionTime(time, volts, np.where(valid, start, -1), start_level), np.nan)
+
+    for type in types:
+        if type == HostMeasurementType.PeakToPeak:
+            value = amplitude
+        elif type == HostMeasurementType.Maximum:
+            value = maximum
+        elif type == HostMeasurementType.Minimum:
+            value = minimum
+        elif type == HostMeasurementType.Mean:
+            value = volts.mean(axis=-1)
+        elif type == HostMeasurementType.RMS:
+            value = np.sqrt(np.mean(volts * volts, axis=-1))
+        elif type == HostMeasurementType.Period:
+            value = period()
+        elif type == HostMeasurementType.Frequency:
+            with np.errstate(divide="ignore"):
+                value = 1 / period()
+        elif type == HostMeasurementType.RiseTime:
+            value = transition_time(rising=True)
+        elif type == HostMeasurementType.FallTime:
+            value = transition_time(rising=False)
+        elif type == HostMeasurementType.DutyCycle:
+            transitions, filled, _ = edges_at_middle()
+
+            # Only whole periods, from the first to the last rising edge
+            indices = np.arange(volts.shape[-1])
+            window = (indices >= _FirstIndex(transitions)[:, None]) & (indices < _LastIndex(transitions)[:, None])
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                value = 100 * ((filled == 1) & window).sum(axis=-1) / window.sum(axis=-1)
+            value = np.where(transitions.sum(axis=-1) >= 2, value, np.nan)
+        elif type == HostMeasurementType.Crossings:
+            transitions, filled, _ = edges_at_middle()
+
+            falling = np.zeros(volts.shape, dtype=bool)
+            falling[:, 1:] = (filled[:, :-1] == 1) & (filled[:, 1:] == -1)
+
+            value = (transitions.sum(axis=-1) + falling.sum(axis=-1)).astype(np.float64)
+        else:
+            raise ValueError(f"Unknown measurement {type}")
+
+        results[type] = np.asarray(value, dtype=np.float64).reshape(shape)
+
+    return results
@@ -0,0 +1,750 @@
+from enum import Enum, IntEnum
+import dataclasses
+from dataclasses import dataclass
+from functools import cached_property
+import csv
+import os
+import select
+import struct
+import fcntl
+import threading
+import queue
+import itertools
+import concurrent.futures
+import time
+import numpy as np
+
+
+class OscilloscopeChannel(Enum):
+    CH1 = "CH1"
+    CH2 = "CH2"
+
+# Everything DAT:SOU can select, math and reference waveforms have to be displayed to be read
+class OscilloscopeSource(Enum):
+    CH1 = "CH1"
+    CH2 = "CH2"
+    MATH = "MATH"
+    REFA = "REFA"
+    REFB = "REFB"
+
+class OscilloscopeMeasurementType(Enum):
+    PeakToPeak = "PK2PK"
+    Frequency = "FREQ"
+    Period = "PERI"
+    Maximum = "MAXI"
+    Minimum = "MINI"
+    
+class OscilloscopeEncoding(Enum):
+    ASCII = "ASCIi"
+    RIBinary = "RIBinary"
+    RPBinary = "RPBinary"
+    SRIbinary = "SRIbinary"
+    SRPbinary = "SRPbinary"
+    
+class LogLevel(IntEnum):
+    Off = 0
+    Error = 1
+    Info = 2
+    Verbose = 3
+    
+
+# _IOW('[', 10, __u32) from linux/usb/tmc.h
+USBTMC_IOCTL_SET_TIMEOUT = 0x40045B0A
+
+# Commands after which the instrument settings can no longer be assumed
+SETTINGS_RESET_COMMANDS = ("*RST", "*RCL", "FAC", "RECA")
+
+# Longest compound command sent to the instrument in one transaction
+MEASUREMENT_COMMAND_LIMIT = 250
+
+# Commands that may change the vertical or horizontal scale of the waveforms
+PREAMBLE_RESET_COMMANDS = SETTINGS_RESET_COMMANDS + ("CH", "HOR", "MATH", "REF", "ACQ", "AUTOS", "SAV")
+
+# Points of every waveform record, the default DAT:STAR 1 to DAT:STOP range
+OSCILLOSCOPE_RECORD_LENGTH = 2500
+
+
+class OscilloscopeSession:
+    def __init__(self, port, timeout=2.0, preamble_max_age=1.0, log=None, profiler=None):
+        self.port = port
+        self.timeout = timeout
+        
+        # Called with (message, LogLevel) for every command, may be None
+        self.log = log
+        
+        # instrumentation.CommandProfiler timing every command, may be None
+        self.profiler = profiler
+        # perf_counter() when the first byte after the last write arrived, None until then
+        self.first_byte_time = None
+        
+        self.lock = threading.RLock()
+        
+        # Shadow copy of the settings written through OscilloscopeSetSetting
+        self.settings = {}
+        
+        # Front panel changes can't be seen from here, so cached preambles also expire
+        self.preambles = {}
+        self.preamble_max_age = preamble_max_age
+        
+        # Decodes curve payloads off the I/O thread while the session is open, see OscilloscopeCurvesRaw.
+        # One per session so the instruments don't wait on each other's payloads
+        self.decoder = None
+        
+        self._fd = None
+        self._buffer = bytearray()
+        self._poll = False
+        
+    def open(self):
+        with self.lock:
+            if self._fd is not None:
+                return
+            
+            self._fd = os.open(self.port, os.O_RDWR | os.O_NOCTTY)
+            self.decoder = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"decoder-{os.path.basename(self.port)}")
+            self._buffer.clear()
+            self.invalidate_settings()
+            self.set_timeout(self.timeout)
+            
+    def close(self):
+        with self.lock:
+            if self._fd is None:
+                return
+            
+            try:
+                os.close(self._fd)
+            finally:
+                self._fd = None
+                self._buffer.clear()
+                
+                # Payloads already submitted are still decoded
+                self.decoder.shutdown(wait=False)
+                self.decoder = None
+                
+    def reconnect(self):
+        with self.lock:
+            self.close()
+            self.open()
+            
+    def invalidate_settings(self):
+        with self.lock:
+            self.settings.clear()
+            self.preambles.clear()
+            
+    def invalidate_preambles(self):
+        with self.lock:
+            self.preambles.clear()
+            
+    def set_timeout(self, timeout):
+        with self.lock:
+            self.timeout = timeout
+            
+            if self._fd is None:
+                return
+            
+            # The usbtmc driver enforces the timeout itself, anything else (e.g. a pty) is polled
+            try:
+                fcntl.ioctl(self._fd, USBTMC_IOCTL_SET_TIMEOUT, struct.pack("I", int(timeout * 1000)))
+                self._poll = False
+            except OSError:
+                self._poll = True
+                
+    def write(self, message):
+        with self.lock:
+            header = message.lstrip(":").upper()
+            if header.startswith(SETTINGS_RESET_COMMANDS):
+                self.invalidate_settings()
+            elif header.startswith(PREAMBLE_RESET_COMMANDS) and not header.split(" ")[0].endswith("?"):
+                self.invalidate_preambles()
+                
+            self.first_byte_time = None
+            
+            data = memoryview(f"{message}\n".encode("ascii"))
+            while data:
+                written = os.write(self._fd, data)
+                data = data[written:]
+                
+    def _wait(self):
+        if self._poll:
+            ready, _, _ = select.select([self._fd], [], [], self.timeout)
+            if not ready:
+                raise TimeoutError(f"No response from {self.port} within {self.timeout} s")
+                
+    def _fill(self):
+        self._wait()
+            
+        chunk = os.read(self._fd, 65536)
+        if not chunk:
+            raise ConnectionError(f"{self.port} closed the connection")
+        
+        if self.first_byte_time is None:
+            self.first_byte_time = time.perf_counter()
+        
+        self._buffer += chunk
+            
+    def readline(self):
+        with self.lock:
+            while (end := self._buffer.find(b"\n")) < 0:
+                self._fill()
+                
+            line = bytes(self._buffer[:end + 1])
+            del self._buffer[:end + 1]
+            
+            return line.decode("ascii", errors="replace")
+        
+    def read_bytes(self, size):
+        with self.lock:
+            while len(self._buffer) < size:
+                self._fill()
+                
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            
+            return data
+        
+    def read_block(self):
+        # IEEE 488.2 definite length block: #<digits><length><data><LF>
+        with self.lock:
+            header = self.read_bytes(2)
+            if header[:1] != b"#" or not header[1:2].isdigit() or header[1:2] == b"0":
+                raise ValueError(f"Expected a definite length block, got {header!r}")
+            
+            length = int(self.read_bytes(int(header[1:2])))
+            
+            block = bytearray(length)
+            view = memoryview(block)
+            
+            filled = min(len(self._buffer), length)
+            view[:filled] = self._buffer[:filled]
+            del self._buffer[:filled]
+            
+            # Read the payload straight into the block instead of going through the line buffer
+            while filled < length:
+                self._wait()
+                
+                read = os.readv(self._fd, [view[filled:]])
+                if read == 0:
+                    raise ConnectionError(f"{self.port} closed the connection")
+                
+                filled += read
+                
+            self.readline()
+            
+            return block
+        
+    def query(self, message):
+        with self.lock:
+            self.write(message)
+            return self.readline()
+
+
+class OscilloscopeRequestPriority(IntEnum):
+    High = 0
+    Normal = 1
+    Low = 2
+    
+
+class OscilloscopeRequest:
+    def __init__(self, function, args, priority, callback, error_callback, cancel_callback, owner):
+        self.function = function
+        self.args = args
+        self.priority = priority
+        self.callback = callback
+        self.error_callback = error_callback
+        self.cancel_callback = cancel_callback
+        self.owner = owner
+        
+        self.cancelled = False
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        
+    def cancel(self):
+        self.cancelled = True
+        
+
+class OscilloscopeWorker:
+    # Owns the session: every device access happens on this thread, results are handed back through process_results.
+    # A request can be cancelled until process_results delivers it, then its cancel_callback is called instead
+    def __init__(self, ser, error_callback=None):
+        self.ser = ser
+        self.error_callback = error_callback
+        
+        self._requests = queue.PriorityQueue()
+        self._results = queue.SimpleQueue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._order = itertools.count()
+        self._thread = threading.Thread(target=self._run, name=f"io-{ser.port}", daemon=True)
+        
+        # Set once stop is called, nothing submitted after that runs
+        self.stopped = False
+        
+    def start(self):
+        self._thread.start()
+        
+    def stop(self, timeout=None):
+        # Like process_results, only from the thread that handles the results
+        self.stopped = True
+        self.cancel()
+        # Sorts ahead of every request so the thread exits once the current one is done
+        self._requests.put((-1, next(self._order), None))
+        self._thread.join(timeout)
+        
+        # Queued requests never reach process_results, their owners are told here
+        with self._pending_lock:
+            cancelled = list(self._pending)
+            self._pending.clear()
+            
+        for request in cancelled:
+            if request.cancel_callback is not None:
+                request.cancel_callback(request)
+        
+    def submit(self, function, *args, priority=OscilloscopeRequestPriority.Normal, callback=None, error_callback=None, cancel_callback=None, owner=None):
+        request = OscilloscopeRequest(function, args, priority, callback, error_callback, cancel_callback, owner)
+        
+        with self._pending_lock:
+            self._pending.add(request)
+            
+        self._requests.put((int(priority), next(self._order), request))
+        
+        return request
+    
+    def cancel(self, owner=None):
+        with self._pending_lock:
+            for request in self._pending:
+                if owner is None or request.owner == owner:
+                    request.cancel()
+                    
+    def _run(self):
+        while True:
+            _, _, request = self._requests.get()
+            if request is None:
+                return
+            
+            if not request.cancelled:
+                try:
+                    request.result = request.function(self.ser, *request.args)
+                except Exception as error:
+                    request.error = error
+                    
+            request.done.set()
+            self._results.put(request)
+            
+    def process_results(self):
+        while True:
+            try:
+                request = self._results.get_nowait()
+            except queue.Empty:
+                return
+            
+            with self._pending_lock:
+                if request not in self._pending:
+                    # Already reported by stop
+                    continue
+                
+                self._pending.discard(request)
+            
+            if request.cancelled:
+                if request.cancel_callback is not None:
+                    request.cancel_callback(request)
+                continue
+            
+            if request.error is not None:
+                error_callback = request.error_callback or self.error_callback
+                if error_callback is not None:
+                    error_callback(request, request.error)
+            elif request.callback is not None:
+                request.callback(request.result)
+
+
+def OscilloscopeRecordTiming(ser, profiler, message, start, sent, received_bytes):
+    end = time.perf_counter()
+    
+    # A response that was already buffered arrived before the read started
+    first_byte = end if ser.first_byte_time is None else ser.first_byte_time
+    
+    profiler.record(message, sent - start, max(first_byte - sent, 0.0), end - sent, received_bytes)
+    
+    
+def OscilloscopeRecordParse(profiler, start):
+    # Time spent turning the last response into values
+    if profiler is not None:
+        profiler.parsed(time.perf_counter() - start)
+
+
+# ser.profiler is read once per command, profiling may be turned off from another thread in between
+
+def OscilloscopeSendCommand(ser, message):
+    profiler = ser.profiler
+    
+    start = time.perf_counter()
+    ser.write(message)
+    
+    if profiler is not None:
+        profiler.record(message, time.perf_counter() - start)
+    
+    if ser.log is not None:
+        ser.log(f"-> {message}", LogLevel.Verbose)
+    
+    
+def OscilloscopeSendCommandAndRead(ser, message):
+    with ser.lock:
+        start = time.perf_counter()
+        ser.write(message)
+        sent = time.perf_counter()
+        res = ser.readline()
+        
+        profiler = ser.profiler
+        if profiler is not None:
+            OscilloscopeRecordTiming(ser, profiler, message, start, sent, len(res))
+        
+    if ser.log is not None:
+        ser.log(f"-> {message}", LogLevel.Verbose)
+        ser.log(f"<- {res.rstrip()}", LogLevel.Verbose)
+    
+    return res
+
+
+def OscilloscopeSendCommandAndReadBlock(ser, message):
+    with ser.lock:
+        start = time.perf_counter()
+        ser.write(message)
+        sent = time.perf_counter()
+        res = ser.read_block()
+        
+        profiler = ser.profiler
+        if profiler is not None:
+            OscilloscopeRecordTiming(ser, profiler, message, start, sent, len(res))
+    
+    if ser.log is not None:
+        ser.log(f"-> {message}", LogLevel.Verbose)
+        ser.log(f"<- #<{len(res)} bytes>", LogLevel.Verbose)
+    
+    return res
+
+
+def OscilloscopeSetSetting(ser, header, value):
+    value = str(value)
+    
+    with ser.lock:
+        if ser.settings.get(header) == value:
+            return
+        
+        # Forget the old value first, a failed write leaves the instrument state unknown
+        ser.settings.pop(header, None)
+        OscilloscopeSendCommand(ser, f"{header} {value}")
+        ser.settings[header] = value
+
+
+def OscilloscopeSplitResponse(response):
+    # Fields are separated by ';', quoted strings (e.g. WFID) may contain separators
+    return next(csv.reader([response.strip()], delimiter=";", quotechar='"'))
+
+
+@dataclass
+class OscilloscopePreamble:
+    byte_nr: int
+    bit_nr: int
+    encoding: str
+    binary_format: str
+    byte_order: str
+    nr_pt: int
+    wfid: str
+    point_format: str
+    xincr: float
+    pt_off: int
+    xzero: float
+    xunit: str
+    ymult: float
+    yzero: float
+    yoff: float
+    yunit: str
+    # Record point (1-based) of the first point and record points from one point to the next, see window
+    start: int = 1
+    stride: int = 1
+    
+    @classmethod
+    def parse(cls, response):
+        fields = OscilloscopeSplitResponse(response)
+        if len(fields) < 16:
+            raise ValueError(f"Incomplete waveform preamble (is the source displayed?): {response.strip()}")
+        
+        return cls(
+            byte_nr=int(fields[0]),
+            bit_nr=int(fields[1]),
+            encoding=fields[2],
+            binary_format=fields[3],
+            byte_order=fields[4],
+            nr_pt=int(fields[5]),
+            wfid=fields[6],
+            point_format=fields[7],
+            xincr=float(fields[8]),
+            pt_off=int(float(fields[9])),
+            xzero=float(fields[10]),
+            xunit=fields[11],
+            ymult=float(fields[12]),
+            yzero=float(fields[13]),
+            yoff=float(fields[14]),
+            yunit=fields[15],
+        )
+    
+    @cached_property
+    def time(self):
+        return self.xzero + (np.arange(self.nr_pt) - self.pt_off) * self.xincr
+    
+    def volts(self, points):
+        return (points - self.yoff) * self.ymult + self.yzero
+    
+    def window(self, start, stop, stride=1):
+        # Preamble of the record points start, start + stride, ... up to stop (1-based like DAT:STAR and DAT:STOP),
+        # self being the one read with that DAT:STAR and DAT:STOP. The instrument then reports NR_PT and PT_OFF
+        # for the transferred points, one that describes the whole record instead (NR_PT larger than the range)
+        # is offset to DAT:STAR here. Windows are kept with the preamble so every capture of the same window
+        # shares the time axis
+        first = start - 1 if self.nr_pt > stop - start + 1 else 0
+        if start == 1 and stride == 1 and self.nr_pt <= stop:
+            return self
+        
+        windows = self.__dict__.setdefault("_windows", {})
+        
+        key = (start, stop, stride)
+        if key not in windows:
+            windows[key] = dataclasses.replace(
+                self,
+                nr_pt=len(range(0, min(self.nr_pt - first, stop - start + 1), stride)),
+                xincr=self.xincr * stride,
+                pt_off=0,
+                xzero=self.xzero + (first - self.pt_off) * self.xincr,
+                start=start,
+                stride=stride,
+            )
+            
+        return windows[key]
+    
+    def record_point(self, time):
+        # Fractional record point (1-based) at time, for any window of the record
+        return self.start + (self.pt_off + (time - self.xzero) / self.xincr) * self.stride
+
+
+def OscilloscopeWaveformPreamble(ser, refresh=False):
+    # Describes the DAT:SOU waveform with the current DAT:ENC, DAT:WID, DAT:START and DAT:STOP
+    with ser.lock:
+        # NR_PT and PT_OFF depend on DAT:START and DAT:STOP too
+        key = (ser.settings.get("DAT:SOU"), ser.settings.get("DAT:ENC"), ser.settings.get("DAT:WID"), ser.settings.get("DAT:START"), ser.settings.get("DAT:STOP"))
+        
+        cached = ser.preambles.get(key)
+        if not refresh and None not in key and cached is not None and time.monotonic() - cached[0] < ser.preamble_max_age:
+            return cached[1]
+        
+        response = OscilloscopeSendCommandAndRead(ser, "WFMPre?")
+        
+        start = time.perf_counter()
+        preamble = OscilloscopePreamble.parse(response)
+        OscilloscopeRecordParse(ser.profiler, start)
+        ser.preambles[key] = (time.monotonic(), preamble)
+        
+        return preamble
+
+
+def OscilloscopeEncodingDtype(encoding: OscilloscopeEncoding, width):
+    byteorder = "<" if encoding in (OscilloscopeEncoding.SRIbinary, OscilloscopeEncoding.SRPbinary) else ">"
+    kind = "i" if encoding in (OscilloscopeEncoding.RIBinary, OscilloscopeEncoding.SRIbinary) else "u"
+    
+    return np.dtype(f"{byteorder}{kind}{width}")
+
+
+def OscilloscopeId(ser):
+    id = OscilloscopeSendCommandAndRead(ser, f"ID?")
+    
+    return id
+
+def OscilloscopeAlle(ser):
+    alle = OscilloscopeSendCommandAndRead(ser, f"ALLE?")
+    
+    return alle
+
+def OscilloscopeImmediateMeasure(ser, channel: OscilloscopeChannel, type: OscilloscopeMeasurementType):
+    
+    OscilloscopeSetSetting(ser, "MEASU:IMM:SOU", channel.value)
+    OscilloscopeSetSetting(ser, "MEASU:IMM:TYPE", type.value)
+    
+    value = OscilloscopeSendCommandAndRead(ser, f"MEASU:IMM:VAL?")
+    
+    unit_str = OscilloscopeSendCommandAndRead(ser, f"MEASU:IMM:UNI?")
+     
+    return (value, unit_str)
+
+def OscilloscopeMeasureTable(ser, measurements, max_command_length=MEASUREMENT_COMMAND_LIMIT):
+    # measurements is a list of (OscilloscopeChannel, OscilloscopeMeasurementType), results keep its order
+    order = sorted(range(len(measurements)), key=lambda i: (measurements[i][0].value, measurements[i][1].value))
+    results = [None] * len(measurements)
+    
+    with ser.lock:
+        source = ser.settings.get("MEASU:IMM:SOU")
+        type = ser.settings.get("MEASU:IMM:TYPE")
+        
+        chunk = []
+        chunk_indices = []
+        
+        def send_chunk():
+            # Forget the settings first, a failed transaction leaves them unknown
+            ser.settings.pop("MEASU:IMM:SOU", None)
+            ser.settings.pop("MEASU:IMM:TYPE", None)
+            
+            response = OscilloscopeSendCommandAndRead(ser, "MEASU:IMM:" + ";".join(chunk))
+            
+            start = time.perf_counter()
+            fields = OscilloscopeSplitResponse(response)
+            OscilloscopeRecordParse(ser.profiler, start)
+            if len(fields) != 2 * len(chunk_indices):
+                raise ValueError(f"Expected {2 * len(chunk_indices)} values, got {len(fields)}")
+            
+            for n, i in enumerate(chunk_indices):
+                results[i] = (fields[2 * n], fields[2 * n + 1])
+                
+            ser.settings["MEASU:IMM:SOU"] = source
+            ser.settings["MEASU:IMM:TYPE"] = type
+            
+            chunk.clear()
+            chunk_indices.clear()
+        
+        for i in order:
+            channel, measurement_type = measurements[i]
+            
+            commands = []
+            if source != channel.value:
+                commands.append(f"SOU {channel.value}")
+            if type != measurement_type.value:
+                commands.append(f"TYPE {measurement_type.value}")
+            commands += ["VAL?", "UNI?"]
+            
+            if chunk and len("MEASU:IMM:" + ";".join(chunk + commands)) > max_command_length:
+                # The next chunk can't rely on what this one selected
+                send_chunk()
+                commands = [f"SOU {channel.value}", f"TYPE {measurement_type.value}", "VAL?", "UNI?"]
+                
+            chunk += commands
+            chunk_indices.append(i)
+            source = channel.value
+            type = measurement_type.value
+            
+        if chunk:
+            send_chunk()
+            
+    return results
+
+
+def OscilloscopeCurveTransfer(ser, source, encoding: OscilloscopeEncoding = OscilloscopeEncoding.RIBinary, width=2, start=1, stop=OSCILLOSCOPE_RECORD_LENGTH, stride=1):
+    # Selects the source and reads the record points start to stop of its curve, the payload is left for
+    # OscilloscopeDecodeCurve. The instrument has no stride, the preamble describes the points kept after decoding
+    with ser.lock:
+        OscilloscopeSetSetting(ser, "DAT:ENC", encoding.value)
+        OscilloscopeSetSetting(ser, "DAT:SOU", source.value)
+        OscilloscopeSetSetting(ser, "DAT:START", start)
+        OscilloscopeSetSetting(ser, "DAT:STOP", stop)
+        OscilloscopeSetSetting(ser, "DAT:WID", width)
+        
+        preamble = OscilloscopeWaveformPreamble(ser).window(start, stop, stride)
+        
+        if encoding == OscilloscopeEncoding.ASCII:
+            payload = OscilloscopeSendCommandAndRead(ser, f"CURV?")
+        else:
+            payload = OscilloscopeSendCommandAndReadBlock(ser, f"CURV?")
+            
+    return payload, preamble
+
+
+def OscilloscopeDecodeCurve(payload, encoding: OscilloscopeEncoding, width, stride=1):
+    # Points in the host byte order, ASCII ones get the same width as the binary encodings
+    if encoding == OscilloscopeEncoding.ASCII:
+        points = np.fromstring(payload, dtype=f"i{width}", sep=",")
+    else:
+        dtype = OscilloscopeEncodingDtype(encoding, width)
+        points = np.frombuffer(payload, dtype=dtype).astype(dtype.newbyteorder("="), copy=False)
+        
+    # The instrument has no stride of its own, every point between start and stop is transferred
+    return points[::stride]
+
+
+def OscilloscopeDecodeCurveTimed(payload, encoding: OscilloscopeEncoding, width, stride=1):
+    start = time.perf_counter()
+    points = OscilloscopeDecodeCurve(payload, encoding, width, stride)
+    
+    return points, time.perf_counter() - start
+
+
+def OscilloscopeCurveRaw(ser, channel, encoding: OscilloscopeEncoding = OscilloscopeEncoding.RIBinary, width=2, start=1, stop=OSCILLOSCOPE_RECORD_LENGTH, stride=1):
+    payload, preamble = OscilloscopeCurveTransfer(ser, channel, encoding, width, start, stop, stride)
+    
+    parse_start = time.perf_counter()
+    points = OscilloscopeDecodeCurve(payload, encoding, width, stride)
+    OscilloscopeRecordParse(ser.profiler, parse_start)
+        
+    return points, preamble
+
+
+def OscilloscopeCurveArray(points, preamble: OscilloscopePreamble):
+    voltage = preamble.volts(points)
+    time = preamble.time[:len(points)]
+    
+    return np.array([time, points, voltage]).T
+
+
+def OscilloscopeCurve(ser, channel, encoding: OscilloscopeEncoding = OscilloscopeEncoding.RIBinary, width=2, start=1, stop=OSCILLOSCOPE_RECORD_LENGTH, stride=1):
+    return OscilloscopeCurveArray(*OscilloscopeCurveRaw(ser, channel, encoding, width, start, stop, stride))
+
+
+def OscilloscopeCurvesRaw(ser, sources, encoding: OscilloscopeEncoding = OscilloscopeEncoding.RIBinary, width=2, start=1, stop=OSCILLOSCOPE_RECORD_LENGTH, stride=1):
+    # One frame of (points, preamble) per source, in order. ASCII payloads are parsed on ser.decoder
+    # while the next source is set up and transferred, binary ones only need a view and are cheaper to decode here
+    transfers = []
+    
+    with ser.lock:
+        for source in sources:
+            payload, preamble = OscilloscopeCurveTransfer(ser, source, encoding, width, start, stop, stride)
+            
+            if encoding == OscilloscopeEncoding.ASCII:
+                decoding = ser.decoder.submit(OscilloscopeDecodeCurveTimed, payload, encoding, width, stride)
+            else:
+                decoding = concurrent.futures.Future()
+                decoding.set_result(OscilloscopeDecodeCurveTimed(payload, encoding, width, stride))
+                
+            transfers.append((decoding, preamble))
+            
+    profiler = ser.profiler
+    
+    curves = []
+    for decoding, preamble in transfers:
+        points, seconds = decoding.result()
+        
+        if profiler is not None:
+            profiler.parsed(seconds, "CURV?")
+        
+        curves.append((points, preamble))
+        
+    return curves
+
+
+def OscilloscopeCurves(ser, sources, encoding: OscilloscopeEncoding = OscilloscopeEncoding.RIBinary, width=2, start=1, stop=OSCILLOSCOPE_RECORD_LENGTH, stride=1):
+    return [OscilloscopeCurveArray(points, preamble) for points, preamble in OscilloscopeCurvesRaw(ser, sources, encoding, width, start, stop, stride)]
+
+
+def OscilloscopeCurvesParallel(workers, sources, encoding: OscilloscopeEncoding = OscilloscopeEncoding.RIBinary, width=2, start=1, stop=OSCILLOSCOPE_RECORD_LENGTH, stride=1, timeout=None):
+    # One OscilloscopeCurvesRaw frame per worker, every instrument is read at the same time on its own I/O thread.
+    # Blocks until all of them are done, meant for callers that don't run process_results
+    requests = [worker.submit(OscilloscopeCurvesRaw, sources, encoding, width, start, stop, stride, priority=OscilloscopeRequestPriority.High) for worker in workers]
+    
+    frames = []
+    for worker, request in zip(workers, requests):
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"No frame from {worker.ser.port} within {timeout} s")
+        
+        # The result was also queued for process_results
+        worker.process_results()
+        
+        if request.error is not None:
+            raise request.error
+        
+        frames.append(request.result)
+        
+    return frames
@@ -0,0 +1,224 @@
+import os
+import json
+import queue
+import threading
+import dataclasses
+import numpy as np
+from oscilloscope import OscilloscopePreamble
+
+
+RECORDING_SAMPLES_FILE = "samples.raw"
+RECORDING_INDEX_FILE = "index.jsonl"
+
+# Bytes buffered by the writer before they reach the disk
+RECORDING_WRITE_BUFFER = 1 << 20
+
+
+class WaveformRecorder:
+    # Appends captures to <path>/samples.raw, described line by line in <path>/index.jsonl
+    def __init__(self, path, max_queued=1024, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+
+        self.recorded = 0
+        self.dropped = 0
+        self.error = None
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        # id() of the preamble objects already written, mapped to (index id, preamble) to keep them alive
+        self._preambles = {}
+        self._next_preamble_id = 0
+        self._offset = 0
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{os.path.basename(path)}", daemon=True)
+
+    def start(self):
+        os.makedirs(self.path, exist_ok=True)
+
+        # Continue an existing recording without reusing its preamble ids
+        index_path = os.path.join(self.path, RECORDING_INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as index_file:
+                for line in index_file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        if entry["type"] == "preamble":
+                            self._next_preamble_id = max(self._next_preamble_id, entry["id"] + 1)
+
+        self._samples_file = open(os.path.join(self.path, RECORDING_SAMPLES_FILE), "ab", buffering=RECORDING_WRITE_BUFFER)
+        self._index_file = open(os.path.join(self.path, RECORDING_INDEX_FILE), "a", buffering=RECORDING_WRITE_BUFFER)
+        self._offset = self._samples_file.tell()
+
+        self._thread.start()
+
+    def stop(self):
+        # A writer that failed no longer reads the queue, it may be full
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=self.flush_interval)
+                break
+            except queue.Full:
+                pass
+
+        self._thread.join()
+
+    def append(self, timestamp, channels):
+        # channels is a list of (source, points, preamble), the arrays are not copied
+        if self.error is not None or not self._thread.is_alive():
+            self.dropped = self.dropped + 1
+            return
+
+        try:
+            self._queue.put_nowait((timestamp, channels))
+        except queue.Full:
+            self.dropped = self.dropped + 1
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    self._flush()
+                    continue
+
+                if item is None:
+                    break
+
+                self._write(*item)
+        except Exception as error:
+            self.error = error
+        finally:
+            try:
+                self._flush()
+            except Exception as error:
+                self.error = self.error or error
+            finally:
+                self._samples_file.close()
+                self._index_file.close()
+
+    def _flush(self):
+        self._samples_file.flush()
+        self._index_file.flush()
+
+    def _write(self, timestamp, channels):
+        record = {"type": "record", "timestamp": timestamp, "offset": self._offset, "channels": []}
+
+        for source, points, preamble in channels:
+            # Recordings are always stored in the host byte order
+            points = np.ascontiguousarray(points, dtype=points.dtype.newbyteorder("="))
+
+            if id(preamble) in self._preambles:
+                preamble_id = self._preambles[id(preamble)][0]
+            else:
+                preamble_id = self._next_preamble_id
+                self._next_preamble_id = self._next_preamble_id + 1
+                self._preambles[id(preamble)] = (preamble_id, preamble)
+                self._index_file.write(json.dumps({"type": "preamble", "id": preamble_id, "fields": dataclasses.asdict(preamble)}) + "\n")
+
+            self._samples_file.write(points.data)
+
+            record["channels"].append({"source": source, "preamble": preamble_id, "length": len(points), "dtype": points.dtype.str})
+            self._offset = self._offset + points.nbytes
+
+        self._index_file.write(json.dumps(record) + "\n")
+        self.recorded = self.recorded + 1
+
+
+class WaveformRecording:
+    # Read side of WaveformRecorder, samples are memory mapped and never loaded as a whole
+    def __init__(self, path):
+        self.path = path
+
+        self.preambles = {}
+        self.records = []
+
+        with open(os.path.join(path, RECORDING_INDEX_FILE)) as index_file:
+            for line in index_file:
+                if not line.strip():
+                    continue
+
+                entry = json.loads(line)
+                if entry["type"] == "preamble":
+                    self.preambles[entry["id"]] = OscilloscopePreamble(**entry["fields"])
+                else:
+                    self.records.append(entry)
+
+        samples_path = os.path.join(path, RECORDING_SAMPLES_FILE)
+        self._samples = np.memmap(samples_path, dtype=np.uint8, mode="r") if os.path.getsize(samples_path) else np.zeros(0, dtype=np.uint8)
+
+        self.timestamps = np.array([record["timestamp"] for record in self.records])
+
+    def __len__(self):
+        return len(self.records)
+
+    def sources(self):
+        return sorted({channel["source"] for record in self.records for channel in record["channels"]})
+
+    def record(self, index):
+        record = self.records[index]
+        channels = {}
+
+        offset = record["offset"]
+        for channel in record["channels"]:
+            dtype = np.dtype(channel["dtype"])
+            channels[channel["source"]] = (self._samples[offset:offset + channel["length"] * dtype.itemsize].view(dtype), self.preambles[channel["preamble"]])
+            offset = offset + channel["length"] * dtype.itemsize
+
+        return channels
+
+    def _locations(self, source):
+        indices = []
+        offsets = []
+        layouts = set()
+
+        for index, record in enumerate(self.records):
+            offset = record["offset"]
+            for channel in record["channels"]:
+                if channel["source"] == source:
+                    indices.append(index)
+                    offsets.append(offset)
+                    layouts.add((channel["length"], channel["dtype"]))
+                offset = offset + channel["length"] * np.dtype(channel["dtype"]).itemsize
+
+        return np.array(indices, dtype=np.int64), np.array(offsets, dtype=np.int64), layouts
+
+    def raw(self, source):
+        # (records, points) array of the source and the indices of the records it appears in
+        indices, offsets, layouts = self._locations(source)
+        if not layouts:
+            return np.zeros((0, 0)), indices
+        if len(layouts) != 1:
+            raise ValueError(f"Records of {source} have different lengths or types: {sorted(layouts)}")
+
+        length, dtype = layouts.pop()
+        dtype = np.dtype(dtype)
+
+        strides = np.diff(offsets)
+        if len(offsets) > 1 and np.all(strides == strides[0]) and strides[0] > 0:
+            # Evenly spaced records are a strided view of the mapped file
+            return np.ndarray((len(offsets), length), dtype=dtype, buffer=self._samples, offset=int(offsets[0]), strides=(int(strides[0]), dtype.itemsize)), indices
+
+        return np.stack([self._samples[offset:offset + length * dtype.itemsize].view(dtype) for offset in offsets]), indices
+
+    def volts(self, source):
+        raw, indices = self.raw(source)
+
+        scales = np.array([self._scale(index, source) for index in indices]).reshape(-1, 3)
+        ymult, yoff, yzero = scales[:, 0:1], scales[:, 1:2], scales[:, 2:3]
+
+        return (raw - yoff) * ymult + yzero
+
+    def time(self, source):
+        raw, indices = self.raw(source)
+        if len(indices) == 0:
+            return np.zeros(0)
+
+        preamble = self.record(indices[0])[source][1]
+
+        return preamble.time[:raw.shape[1]]
+
+    def _scale(self, index, source):
+        for channel in self.records[index]["channels"]:
+            if channel["source"] == source:
+                preamble = self.preambles[channel["preamble"]]
+                return preamble.ymult, preamble.yoff, preamble.yzero
@@ -0,0 +1,139 @@
+from enum import Enum
+from functools import lru_cache
+import numpy as np
+
+
+class SpectrumWindow(Enum):
+    Hann = "HANN"
+    FlatTop = "FLATTOP"
+    BlackmanHarris = "BLACKMANHARRIS"
+
+# Cosine sum coefficients a0, a1, ... of w[n] = a0 - a1 cos(2 pi n / N) + a2 cos(4 pi n / N) - ...
+SPECTRUM_WINDOW_COEFFICIENTS = {
+    SpectrumWindow.Hann: (0.5, 0.5),
+    SpectrumWindow.FlatTop: (0.21557895, 0.41663158, 0.277263158, 0.083578947, 0.006947368),
+    SpectrumWindow.BlackmanHarris: (0.35875, 0.48829, 0.14128, 0.01168),
+}
+
+# Half width of the main lobe [bins], the power of a tone is summed over it
+SPECTRUM_WINDOW_LOBE = {
+    SpectrumWindow.Hann: 3,
+    SpectrumWindow.FlatTop: 5,
+    SpectrumWindow.BlackmanHarris: 4,
+}
+
+# Harmonics, the fundamental included, that count for the THD
+SPECTRUM_HARMONICS = 5
+
+WELCH_OVERLAP = 0.5
+
+
+@lru_cache(maxsize=32)
+def SpectrumWindowCoefficients(window: SpectrumWindow, length):
+    # Periodic window, shared by every spectrum of that length so it must not be modified
+    phase = 2 * np.pi * np.arange(length) / length
+    coefficients = sum((-1) ** k * a * np.cos(k * phase) for k, a in enumerate(SPECTRUM_WINDOW_COEFFICIENTS[window]))
+    coefficients.flags.writeable = False
+
+    return coefficients
+
+
+@lru_cache(maxsize=32)
+def SpectrumFrequencies(length, sample_interval):
+    frequencies = np.fft.rfftfreq(length, sample_interval)
+    frequencies.flags.writeable = False
+
+    return frequencies
+
+
+def PowerSpectrum(volts, sample_interval, window: SpectrumWindow):
+    # One-sided power [V^2] per bin of (..., points) volts, summing the bins of a tone gives its mean square
+    length = volts.shape[-1]
+    coefficients = SpectrumWindowCoefficients(window, length)
+
+    spectrum = np.fft.rfft(volts * coefficients, axis=-1)
+
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    power *= 2 / (length * np.dot(coefficients, coefficients))
+
+    # DC and Nyquist have no negative frequency twin
+    power[..., 0] /= 2
+    if length % 2 == 0:
+        power[..., -1] /= 2
+
+    return SpectrumFrequencies(length, sample_interval), power
+
+
+@lru_cache(maxsize=32)
+def SpectrumNoiseBandwidth(window: SpectrumWindow, length):
+    # Equivalent noise bandwidth [bins] of the window, the power of a bin times it is the squared RMS amplitude
+    # of a tone at the center of that bin (within 0.01 dB anywhere with the flat-top window)
+    coefficients = SpectrumWindowCoefficients(window, length)
+
+    return length * np.dot(coefficients, coefficients) / coefficients.sum() ** 2
+
+
+def WelchPowerSpectralDensity(volts, sample_interval, window: SpectrumWindow, segment_length=None, overlap=WELCH_OVERLAP):
+    # One-sided PSD [V^2/Hz] averaged over the overlapping segments of every waveform of (..., points) volts, in one batch
+    volts = np.asarray(volts, dtype=np.float64)
+    segment_length = volts.shape[-1] if segment_length is None else min(segment_length, volts.shape[-1])
+    step = max(int(segment_length * (1 - overlap)), 1)
+
+    segments = np.lib.stride_tricks.sliding_window_view(volts, segment_length, axis=-1)[..., ::step, :]
+
+    frequencies, power = PowerSpectrum(segments.reshape(-1, segment_length), sample_interval, window)
+    bin_width = 1 / (segment_length * sample_interval)
+
+    return frequencies, power.mean(axis=0) / bin_width
+
+
+def SpectrumMetrics(frequencies, power, window: SpectrumWindow, harmonics=SPECTRUM_HARMONICS):
+    # Fundamental, THD and SNR of a (bins,) power spectrum, the fundamental is its largest tone away from DC
+    lobe = SPECTRUM_WINDOW_LOBE[window]
+    bins = len(power)
+
+    def tone(index):
+        return slice(max(index - lobe, 0), min(index + lobe + 1, bins))
+
+    # The DC lobe ends where the power stops falling, a tone of a few periods per record can sit right after it
+    dc = 1
+    while dc <= lobe and dc < bins and power[dc] < power[dc - 1]:
+        dc = dc + 1
+
+    results = {"frequency": np.nan, "amplitude": np.nan, "thd": np.nan, "snr": np.nan}
+    if bins <= dc + 1:
+        return results
+
+    fundamental = dc + int(np.argmax(power[dc:]))
+    if power[fundamental] <= 0:
+        return results
+
+    # The power weighted mean frequency of the lobe finds the tone between bins
+    fundamental_power = power[tone(fundamental)].sum()
+    frequency = np.dot(frequencies[tone(fundamental)], power[tone(fundamental)]) / fundamental_power
+    bin_width = frequencies[1] - frequencies[0]
+
+    # Every bin that is neither DC, the fundamental nor one of its harmonics is noise
+    noise = np.ones(bins, dtype=bool)
+    noise[:lobe + 1] = False
+    noise[tone(fundamental)] = False
+
+    harmonic_power = 0.0
+    for harmonic in range(2, harmonics + 1):
+        index = int(round(frequency * harmonic / bin_width))
+        if index >= bins:
+            break
+
+        # Bins already counted in a lower tone are left out when the lobes overlap
+        harmonic_power += power[tone(index)][noise[tone(index)]].sum()
+        noise[tone(index)] = False
+
+    noise_power = power[noise].mean() * (bins - lobe - 1) if noise.any() else 0.0
+
+    results["frequency"] = frequency
+    results["amplitude"] = np.sqrt(fundamental_power)
+    results["thd"] = 100 * np.sqrt(harmonic_power / fundamental_power)
+    with np.errstate(divide="ignore"):
+        results["snr"] = 10 * np.log10(fundamental_power / noise_power)
+
+    return results
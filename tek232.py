@@ -1,165 +1,998 @@
 from enum import Enum
 import webbrowser
+import queue
+import itertools
+import time
+import collections
+import os
 import numpy as np
 import dearpygui.dearpygui as dpg
 from dpg_themes import create_theme_imgui_light
-import pyperclip
-from matplotlib import pyplot as plt
+from oscilloscope import (
+    OscilloscopeChannel,
+    OscilloscopeSource,
+    OscilloscopeMeasurementType,
+    OscilloscopeEncoding,
+    LogLevel,
+    OscilloscopeSession,
+    OscilloscopeRequestPriority,
+    OscilloscopeWorker,
+    OscilloscopeId,
+    OscilloscopeAlle,
+    OscilloscopeImmediateMeasure,
+    OscilloscopeMeasureTable,
+    OscilloscopeCurvesRaw,
+    OSCILLOSCOPE_RECORD_LENGTH,
+)
+from recording import WaveformRecorder
+from instrumentation import CommandProfiler
+from waveforms import Waveform, WaveformStore
+from accumulation import AccumulationMode, WaveformAccumulator
+from decimation import DecimationPyramid
+from spectrum import SpectrumWindow, PowerSpectrum, SpectrumNoiseBandwidth, WelchPowerSpectralDensity, SpectrumMetrics
+from measurements import HostMeasurementType, HOST_MEASUREMENT_UNITS, MeasureWaveforms
 
 
-class OscilloscopeChannel(Enum):
-    CH1 = "CH1"
-    CH2 = "CH2"
-
-class OscilloscopeMeasurementType(Enum):
-    PeakToPeak = "PK2PK"
-    Frequency = "FREQ"
-    Period = "PERI"
-    Maximum = "MAXI"
-    Minimum = "MINI"
-    
 class CurveType(Enum):
     Oscilloscope = "OSCILLOSCOPE"
     TrueVoltage = "TRUE_VOLTAGE"
+    
+    
+class CurveView(Enum):
+    Latest = "LATEST"
+    Mean = "MEAN"
+    Envelope = "ENVELOPE"
+    StandardDeviation = "STD"
+    Persistence = "PERSISTENCE"
+
 
-def OscilloscopeSendCommand(ser, message):
-    with open(usbtmc_port, "r+") as ser:
-        ser.write(f"{message}\n")
-        ser.flush()
-    gui_add_to_log(f"-> {message}\n")
+class InstrumentState:
+    def __init__(self, ser, worker):
+        self.ser = ser
+        self.worker = worker
+        
+
+# Connected instruments by USBTMC file, in connection order
+instruments = {}
+
+# Combos choosing an instrument, their items follow the connected instruments
+instrument_combos = []
+
+def gui_rs232_connect():
+    port = dpg.get_value("usbtmc_file_input")
+    
+    # Connecting again to the same file applies the new settings
+    if port in instruments:
+        gui_disconnect_instrument(port)
+    
+    def log(message, level):
+        gui_add_to_log(gui_instrument_message(port, message), level)
+    
+    ser = OscilloscopeSession(port, timeout=dpg.get_value("usbtmc_timeout_input"), preamble_max_age=dpg.get_value("usbtmc_preamble_age_input"), log=log, profiler=command_profiler if profiling_enabled else None)
+    ser.open()
+    
+    worker = OscilloscopeWorker(ser, error_callback=lambda request, error: gui_request_error(request, error, port))
+    worker.start()
+    
+    instruments[port] = InstrumentState(ser, worker)
+    gui_update_instrument_combos(port)
+    
+    dpg.configure_item("usbtmc_file_window", show=False)
+    dpg.configure_item("communication_log_window", show=True)
+    dpg.configure_item("oscilloscope_commands_window", show=True)
+    
+    worker.submit(OscilloscopeId, priority=OscilloscopeRequestPriority.High)
     
     
-def OscilloscopeSendCommandAndRead(ser, message):
-    with open(usbtmc_port, "r+") as ser:
-        ser.write(f"{message}\n")
-        ser.flush()
-        res = ser.readline()
+def gui_disconnect_instrument(port):
+    instrument = instruments.pop(port, None)
+    if instrument is None:
+        return
+    
+    gui_stop_curve_runs(instrument.worker)
+    
+    instrument.worker.stop()
+    instrument.ser.close()
+    
+    gui_update_instrument_combos()
+    gui_add_to_log(f"-- Disconnected from {port}", LogLevel.Info)
+    
+    
+def gui_update_instrument_combos(connected=None):
+    names = list(instruments)
+    
+    for tag in instrument_combos:
+        dpg.configure_item(tag, items=names)
         
+        # A new instrument becomes the target of the commands and of the windows without a connected one
+        if connected is not None and (tag == "instrument_combo" or dpg.get_value(tag) not in instruments):
+            dpg.set_value(tag, connected)
+            
+            
+def gui_add_instrument_combo(tag, **kwargs):
+    instrument_combos.append(tag)
+    
+    return dpg.add_combo(items=list(instruments), label="Instrument", tag=tag, default_value=dpg.get_value("instrument_combo") or "", **kwargs)
+
+
+def gui_worker(combo_tag):
+    # Worker of the instrument chosen in the combo, None (with a log entry) if it is not connected
+    instrument = instruments.get(dpg.get_value(combo_tag))
+    if instrument is None:
+        gui_add_to_log("!! No instrument selected", LogLevel.Error)
+        return None
+    
+    return instrument.worker
+
+
+def gui_instrument_message(port, message):
+    # The log only names the instrument once there is more than one
+    return f"{os.path.basename(port)}: {message}" if len(instruments) > 1 else message
+    
+    
+def gui_rs232_reconnect():
+    def reconnect(ser):
+        ser.reconnect()
+        gui_add_to_log(f"-- Reconnected to {ser.port}", LogLevel.Info)
         
-    gui_add_to_log(f"-> {message}\n")
-    gui_add_to_log(f"<- {res}\n")
+        OscilloscopeId(ser)
+    
+    worker = gui_worker("instrument_combo")
+    if worker is None:
+        return
+    
+    # Runs on the instrument start over once it is reconnected
+    runs = gui_stop_curve_runs(worker)
+    
+    worker.cancel()
+    worker.submit(reconnect, priority=OscilloscopeRequestPriority.High)
+    
+    for cw_index in runs:
+        dpg.set_value(f"curve_run_checkbox_{cw_index}", True)
+        gui_toggle_curve_run(cw_index, True)
+    
+    
+def gui_submit_command(function):
+    worker = gui_worker("instrument_combo")
+    if worker is not None:
+        worker.submit(function, priority=OscilloscopeRequestPriority.High)
+    
+    
+def gui_request_error(request, error, port=None):
+    message = f"{getattr(request.function, '__name__', 'request')}: {error}"
+    if port is not None:
+        message = gui_instrument_message(port, message)
+    
+    gui_add_to_log(f"!! {message}", LogLevel.Error)
     
-    return res
 
+LOG_PAYLOAD_LIMIT = 160
 
-def OscilloscopeId(ser):
-    id = OscilloscopeSendCommandAndRead(ser, f"ID?")
+communication_log_level = LogLevel.Verbose
+communication_log = collections.deque(maxlen=5000)
+communication_log_queue = queue.SimpleQueue()
+
+def gui_add_to_log(message, level=LogLevel.Info):
+    if level > communication_log_level:
+        return
+    
+    # Curves in ASCII are ~15 KB per response, only keep a summary of them
+    if len(message) > LOG_PAYLOAD_LIMIT:
+        message = f"{message[:LOG_PAYLOAD_LIMIT]}... <{len(message)} chars>"
+    
+    # May be called from the I/O worker, the widget is only touched from gui_flush_log
+    communication_log_queue.put(message)
+    
+    
+def gui_flush_log(force=False):
+    updated = force
+    while True:
+        try:
+            communication_log.append(communication_log_queue.get_nowait())
+            updated = True
+        except queue.Empty:
+            break
+        
+    if not updated:
+        return
+    
+    # Only the tail of the log is handed to the widget
+    visible_lines = dpg.get_value("communication_log_visible_input")
+    start = max(0, len(communication_log) - visible_lines)
+    visible_str = "\n".join(itertools.islice(communication_log, start, None))
+    
+    dpg.set_value("communication_log_text", visible_str)
+    dpg.set_item_height("communication_log_text", dpg.get_text_size(visible_str)[1] + (2 * 3))
+    
+    
+def gui_set_log_level(level_name):
+    global communication_log_level
+    communication_log_level = LogLevel[level_name]
+    
+    
+def gui_set_log_capacity(capacity):
+    global communication_log
+    communication_log = collections.deque(communication_log, maxlen=capacity)
+    gui_flush_log(force=True)
+    
+    
+def gui_clear_log():
+    communication_log.clear()
+    gui_flush_log(force=True)
+    
     
-    return id
+command_profiler = CommandProfiler()
+profiling_enabled = False
 
-def OscilloscopeAlle(ser):
-    alle = OscilloscopeSendCommandAndRead(ser, f"ALLE?")
+PERFORMANCE_REFRESH_INTERVAL = 0.5
+performance_last_refresh = 0.0
+
+def gui_set_profiling(enabled):
+    global profiling_enabled
+    profiling_enabled = enabled
+    
+    if enabled:
+        command_profiler.reset()
     
-    return alle
+    # Read by the workers before every command, no need to stop them
+    for instrument in instruments.values():
+        instrument.ser.profiler = command_profiler if enabled else None
+        
+        
+def gui_format_ms(seconds):
+    return "--" if seconds != seconds else f"{seconds * 1e3:.3f}"
+
 
-def OscilloscopeImmediateMeasure(ser, channel: OscilloscopeChannel, type: OscilloscopeMeasurementType):
+def gui_process_performance():
+    global performance_last_refresh
     
-    OscilloscopeSendCommand(ser, f"MEASU:IMM:SOU {channel.value}")
-    OscilloscopeSendCommand(ser, f"MEASU:IMM:TYPE {type.value}")
+    now = time.perf_counter()
+    if not profiling_enabled or not dpg.is_item_shown("performance_window") or now - performance_last_refresh < PERFORMANCE_REFRESH_INTERVAL:
+        return
     
-    value = OscilloscopeSendCommandAndRead(ser, f"MEASU:IMM:VAL?")
+    performance_last_refresh = now
     
-    unit_str = OscilloscopeSendCommandAndRead(ser, f"MEASU:IMM:UNI?")
-     
-    return (value, unit_str)
+    rows = command_profiler.report()
+    elapsed = command_profiler.elapsed()
+    
+    calls = sum(row["calls"] for row in rows)
+    busy = sum(row["time"] for row in rows)
+    dpg.set_value("performance_summary_text", f"{calls / elapsed:.1f} commands/s, link busy {100 * busy / elapsed:.0f} % of {elapsed:.0f} s")
+    
+    dpg.delete_item("performance_table", children_only=True, slot=1)
+    for row in rows:
+        with dpg.table_row(parent="performance_table"):
+            dpg.add_text(row["command"])
+            dpg.add_text(f"{row['calls']}")
+            dpg.add_text(f"{row['rate']:.1f}")
+            dpg.add_text("--" if row["throughput"] != row["throughput"] else f"{row['throughput'] / 1e3:.1f}")
+            dpg.add_text(gui_format_ms(row["first_byte_p50"]))
+            dpg.add_text(gui_format_ms(row["total_p50"]))
+            dpg.add_text(gui_format_ms(row["total_p90"]))
+            dpg.add_text(gui_format_ms(row["total_p99"]))
+            dpg.add_text(gui_format_ms(row["parse_p50"]))
+            
 
-def OscilloscopeCurve(ser, channel: OscilloscopeChannel):
+def gui_export_command_timings():
+    def save_file(sender, app_data):
+        command_profiler.export_csv(app_data["file_path_name"])
+        gui_add_to_log(f"-- Command timings exported to {app_data['file_path_name']}", LogLevel.Info)
     
-    OscilloscopeSendCommand(ser, f"DAT:ENC ASCII")
-    OscilloscopeSendCommand(ser, f"DAT:SOU {channel.value}")
-    OscilloscopeSendCommand(ser, f"DAT:START 1")
-    OscilloscopeSendCommand(ser, f"DAT:STOP 2500")
-    OscilloscopeSendCommand(ser, f"DAT:WID 2")
+    if dpg.does_item_exist("timings_save_dialog"):
+        dpg.delete_item("timings_save_dialog")
+    with dpg.file_dialog(directory_selector=False, show=True, callback=save_file, default_filename="command_timings.csv", tag="timings_save_dialog", width=700 ,height=400):
+        dpg.add_file_extension(".csv")
+        dpg.add_file_extension(".*")
+        
+
+def gui_immediate_measurement(mw_index):
+    channel = OscilloscopeChannel(dpg.get_value(f"measurement_channel_combo_{mw_index}"))
+    type = OscilloscopeMeasurementType(dpg.get_value(f"measurement_type_combo_{mw_index}"))
+    
+    def show_measure(measure):
+        dpg.set_value(f"measurement_text_{mw_index}", f"{measure[0].strip()} {measure[1].strip()}")
     
-    curve_str = OscilloscopeSendCommandAndRead(ser, f"CURV?")
+    owner = f"measurement_window_{mw_index}"
     
-    info_str = OscilloscopeSendCommandAndRead(ser, f"WFMP:WFI?")
+    worker = gui_worker(f"measurement_instrument_combo_{mw_index}")
+    if worker is None:
+        return
     
-    xaxis_info = info_str.split(", ")[3]
-    yaxis_info = info_str.split(", ")[2]
+    worker.cancel(owner)
+    worker.submit(OscilloscopeImmediateMeasure, channel, type, priority=OscilloscopeRequestPriority.High, callback=show_measure, owner=owner)
+    
+    dpg.set_value(f"measurement_text_{mw_index}", "...")
     
-    volts_per_div = float(yaxis_info.split(" ")[0])
-    seconds_per_div = float(xaxis_info.split(" ")[0])
 
-    points = np.array([int(point) for point in curve_str.split(",")])
+def gui_copy_to_clipboard(text):
+    import pyperclip
+    
+    pyperclip.copy(text)
     
-    voltage = (points / 32768 * 10) * volts_per_div
-    time = np.arange(0, 2500, 1) / 2500 * 10 * seconds_per_div
     
-    return np.array([time, points, voltage]).T
+measurement_tables = []
 
+class MeasurementTableState:
+    def __init__(self):
+        self.in_flight = False
+        self.last_refresh = 0.0
 
-ser = None
-usbtmc_port = None
 
-def gui_rs232_connect():
-    global ser
-    global usbtmc_port
+def gui_measurement_table_refresh(mt_index):
+    table = measurement_tables[mt_index]
+    if table.in_flight:
+        return
     
-    usbtmc_port = dpg.get_value("usbtmc_file_input")
+    rows = [(channel, type) for channel in OscilloscopeChannel for type in OscilloscopeMeasurementType
+            if dpg.get_value(f"measurement_table_enabled_{mt_index}_{channel.value}_{type.value}")]
+    if not rows:
+        return
     
-    dpg.configure_item("usbtmc_file_window", show=False)
-    dpg.configure_item("communication_log_window", show=True)
-    dpg.configure_item("oscilloscope_commands_window", show=True)
+    worker = gui_worker(f"measurement_table_instrument_combo_{mt_index}")
+    if worker is None:
+        dpg.set_value(f"measurement_table_auto_{mt_index}", False)
+        return
+    
+    def show_table(results):
+        table.in_flight = False
+        for (channel, type), (value, unit) in zip(rows, results):
+            dpg.set_value(f"measurement_table_value_{mt_index}_{channel.value}_{type.value}", value)
+            dpg.set_value(f"measurement_table_unit_{mt_index}_{channel.value}_{type.value}", unit)
+            
+    def table_error(request, error):
+        table.in_flight = False
+        gui_request_error(request, error, dpg.get_value(f"measurement_table_instrument_combo_{mt_index}"))
+        
+    # Reconnect and Disconnect cancel the refresh, the next one may go
+    def table_cancelled(request):
+        table.in_flight = False
+    
+    table.in_flight = True
+    table.last_refresh = time.perf_counter()
+    worker.submit(OscilloscopeMeasureTable, rows, callback=show_table, error_callback=table_error, cancel_callback=table_cancelled, owner=f"measurement_table_{mt_index}")
+    
+    
+def gui_process_measurement_tables():
+    now = time.perf_counter()
     
-    OscilloscopeId(ser)
+    for mt_index, table in enumerate(measurement_tables):
+        if dpg.get_value(f"measurement_table_auto_{mt_index}") and now - table.last_refresh >= dpg.get_value(f"measurement_table_interval_{mt_index}"):
+            gui_measurement_table_refresh(mt_index)
     
 
-communication_log_str = ""
+waveform_store = WaveformStore()
 
-def gui_add_to_log(message):
-    global communication_log_str
-    communication_log_str = communication_log_str + message
+CURVE_HISTORY_LENGTH = 256
+CURVE_RUN_IN_FLIGHT = 2
+
+class CurveRunState:
+    def __init__(self):
+        self.running = False
+        self.in_flight = 0
+        # Worker the run was started on, in case the window is bound to another instrument meanwhile
+        self.worker = None
+        # Changes whenever the run is started or stopped, late frames of an earlier run are ignored
+        self.generation = 0
+        
+        self.dirty = False
+        self.last_plot = 0.0
+        self.acquired = 0
+        self.dropped = 0
+        self.rate = 0.0
+        self.rate_start = time.perf_counter()
+        self.rate_count = 0
+        
+curve_runs = []
+curve_recorders = []
+
+def gui_curve_sources(cw_index):
+    return [source for source in OscilloscopeSource if dpg.get_value(f"curve_source_checkbox_{cw_index}_{source.value}")]
+
+
+def gui_curve_range(cw_index):
+    # Record points (start, stop, stride) to capture, with "Fetch zoom" the ones visible on the plot
+    if dpg.get_value(f"curve_zoom_fetch_{cw_index}"):
+        for source in OscilloscopeSource:
+            waveform = waveform_store.latest(cw_index, source.value)
+            if waveform is None:
+                continue
+            
+            x_min, x_max = dpg.get_axis_limits(f"x_curve_axis_{cw_index}")
+            start = max(int(np.floor(waveform.preamble.record_point(x_min))), 1)
+            stop = min(int(np.ceil(waveform.preamble.record_point(x_max))), OSCILLOSCOPE_RECORD_LENGTH)
+            
+            if start < stop:
+                dpg.set_value(f"curve_start_input_{cw_index}", start)
+                dpg.set_value(f"curve_stop_input_{cw_index}", stop)
+            break
+        
+    start = dpg.get_value(f"curve_start_input_{cw_index}")
+    stop = max(dpg.get_value(f"curve_stop_input_{cw_index}"), start)
     
-    dpg.set_value("communication_log_text", communication_log_str)
-    dpg.set_item_height("communication_log_text", dpg.get_text_size(communication_log_str)[1] + (2 * 3))
+    return start, stop, dpg.get_value(f"curve_stride_input_{cw_index}")
+
+
+def gui_reset_curve_range(cw_index):
+    dpg.set_value(f"curve_zoom_fetch_{cw_index}", False)
+    dpg.set_value(f"curve_start_input_{cw_index}", 1)
+    dpg.set_value(f"curve_stop_input_{cw_index}", OSCILLOSCOPE_RECORD_LENGTH)
+    dpg.set_value(f"curve_stride_input_{cw_index}", 1)
+
+
+def gui_curve_acquisition(cw_index, sources, done_callback=None):
+    encoding = OscilloscopeEncoding[dpg.get_value(f"curve_encoding_combo_{cw_index}")]
+    width = int(dpg.get_value(f"curve_width_combo_{cw_index}"))
     
+    worker = gui_worker(f"curve_instrument_combo_{cw_index}")
+    if worker is None or not sources:
+        return None
     
-def gui_immediate_measurement(mw_index):
-    channel = OscilloscopeChannel(dpg.get_value(f"measurement_channel_combo_{mw_index}"))
-    type = OscilloscopeMeasurementType(dpg.get_value(f"measurement_type_combo_{mw_index}"))
+    def store_curves(curves):
+        gui_store_curves(cw_index, gui_curve_frame(sources, curves))
+        gui_update_curve_plot(cw_index)
+        
+        if done_callback is not None:
+            done_callback()
+            
+    def acquisition_error(request, error):
+        gui_request_error(request, error, dpg.get_value(f"curve_instrument_combo_{cw_index}"))
+        
+        if done_callback is not None:
+            done_callback()
+    
+    return worker.submit(OscilloscopeCurvesRaw, sources, encoding, width, *gui_curve_range(cw_index), callback=store_curves, error_callback=acquisition_error, owner=f"curve_window_{cw_index}")
+
+
+def gui_cancel_curve_acquisition(cw_index):
+    for instrument in instruments.values():
+        instrument.worker.cancel(f"curve_window_{cw_index}")
+        
+        
+def gui_bind_curve_window(cw_index):
+    # A run keeps going on the instrument it was started on otherwise
+    if curve_runs[cw_index].running:
+        dpg.set_value(f"curve_run_checkbox_{cw_index}", False)
+        gui_toggle_curve_run(cw_index, False)
+        
+    gui_cancel_curve_acquisition(cw_index)
+
+
+def gui_capture_all_instruments():
+    # Every instrument gets a curve window if it has none, then all the windows capture at once.
+    # Each instrument is read by its own worker so the total time is that of the slowest one
+    bound = {dpg.get_value(f"curve_instrument_combo_{cw_index}") for cw_index in range(len(curve_runs))}
+    for port in instruments:
+        if port not in bound:
+            CreateCurveWindow(port)
+            
+    start = time.perf_counter()
+    pending = []
+    
+    def capture_done():
+        pending.pop()
+        if not pending:
+            gui_add_to_log(f"-- Captured {len(instruments)} instruments in {(time.perf_counter() - start) * 1e3:.1f} ms", LogLevel.Info)
     
-    measure = OscilloscopeImmediateMeasure(ser, channel, type)
+    for cw_index in range(len(curve_runs)):
+        if dpg.get_value(f"curve_instrument_combo_{cw_index}") in instruments and gui_curve_sources(cw_index):
+            pending.append(cw_index)
+            
+    for cw_index in list(pending):
+        gui_curve_acquisition(cw_index, gui_curve_sources(cw_index), done_callback=capture_done)
+
+
+def gui_curve_frame(sources, curves):
+    # All the waveforms of one OscilloscopeCurvesRaw call share a timestamp
+    timestamp = time.time()
+    
+    return [Waveform.from_curve(source.value, points, preamble, timestamp) for source, (points, preamble) in zip(sources, curves)]
+
+
+def gui_store_curves(cw_index, waveforms):
+    waveform_store.add(cw_index, waveforms, dpg.get_value(f"curve_history_input_{cw_index}"))
+    gui_record_curves(cw_index, waveforms)
+    gui_accumulate_curves(cw_index, waveforms)
     
-    dpg.set_value(f"measurement_text_{mw_index}", f"{measure[0]} {measure[1]}")
     
+CURVE_ACCUMULATION_COUNT = 16
+
+# Columns of the persistence heat map, the record is summed down to this
+PERSISTENCE_COLUMNS = 500
 
-acquisitions = []
+class CurveAccumulationState:
+    def __init__(self):
+        # Source -> (WaveformAccumulator, scale of the waveforms it accumulates)
+        self.accumulators = {}
+        
+curve_accumulations = []
 
-def gui_curve_acquisition(cw_index, channels):
-    for channel in channels:
-        acquisitions[cw_index][0 if channel == OscilloscopeChannel.CH1 else 1] = OscilloscopeCurve(ser, channel).T
+def gui_accumulate_curves(cw_index, waveforms):
+    mode = AccumulationMode[dpg.get_value(f"curve_accumulation_combo_{cw_index}")]
+    if mode == AccumulationMode.Off:
+        return
+    
+    count = dpg.get_value(f"curve_accumulation_count_{cw_index}")
+    accumulators = curve_accumulations[cw_index].accumulators
+    
+    for waveform in waveforms:
+        preamble = waveform.preamble
+        scale = (len(waveform), preamble.xincr, preamble.xzero, preamble.pt_off, preamble.ymult, preamble.yoff, preamble.yzero)
+        
+        # Statistics of another time base or vertical scale don't mix, start over
+        entry = accumulators.get(waveform.source)
+        if entry is None or entry[1] != scale:
+            entry = accumulators[waveform.source] = (WaveformAccumulator(len(waveform), *waveform.volts_range()), scale)
+            
+        accumulator = entry[0]
+        if accumulator.count >= count:
+            if mode == AccumulationMode.Average:
+                continue
+            if mode == AccumulationMode.Restart:
+                accumulator.reset()
+                
+        accumulator.add(waveform.volts(), count if mode == AccumulationMode.Decay else None)
+        
+    # Sources that are no longer captured keep their statistics but don't hold the average back
+    counts = [accumulators[waveform.source][0].count for waveform in waveforms]
+    dpg.set_value(f"curve_accumulation_status_{cw_index}", f"{min(counts)}/{count}")
+    
+    # An average is complete once every source has its N acquisitions
+    if mode == AccumulationMode.Average and min(counts) >= count and curve_runs[cw_index].running:
+        dpg.set_value(f"curve_run_checkbox_{cw_index}", False)
+        gui_toggle_curve_run(cw_index, False)
+        gui_update_curve_plot(cw_index)
+        
+        
+def gui_reset_curve_accumulation(cw_index):
+    curve_accumulations[cw_index].accumulators.clear()
+    dpg.set_value(f"curve_accumulation_status_{cw_index}", "")
     
     gui_update_curve_plot(cw_index)
 
 
+def gui_set_history_memory(megabytes):
+    waveform_store.memory_limit = megabytes << 20
+    waveform_store.evict()
+
+
+def gui_clear_curve_history(cw_index):
+    waveform_store.clear_history(cw_index)
+    
+    if dpg.get_value(f"curve_measurements_header_{cw_index}"):
+        gui_update_curve_measurements(cw_index)
+        
+    if dpg.get_value(f"curve_spectrum_header_{cw_index}"):
+        gui_update_curve_spectrum(cw_index)
+        
+
+def gui_stop_curve_runs(worker):
+    # Stops every run on the worker, returns their curve windows
+    stopped = []
+    
+    for cw_index, run in enumerate(curve_runs):
+        if run.running and run.worker is worker:
+            dpg.set_value(f"curve_run_checkbox_{cw_index}", False)
+            gui_toggle_curve_run(cw_index, False)
+            stopped.append(cw_index)
+            
+    return stopped
+
+
+def gui_toggle_curve_run(cw_index, running):
+    run = curve_runs[cw_index]
+    
+    if running:
+        if not gui_curve_sources(cw_index):
+            gui_add_to_log("!! No source selected", LogLevel.Error)
+            dpg.set_value(f"curve_run_checkbox_{cw_index}", False)
+            return
+        
+        run.worker = gui_worker(f"curve_instrument_combo_{cw_index}")
+        if run.worker is None:
+            dpg.set_value(f"curve_run_checkbox_{cw_index}", False)
+            return
+        
+    run.running = running
+    run.generation = run.generation + 1
+    
+    if running:
+        run.acquired = 0
+        run.dropped = 0
+        run.rate_start = time.perf_counter()
+        run.rate_count = 0
+        
+        # Keep the worker busy while the GUI thread handles the previous frame
+        while run.running and run.in_flight < CURVE_RUN_IN_FLIGHT:
+            gui_submit_curve_run(cw_index)
+    elif run.worker is not None:
+        run.worker.cancel(f"curve_run_{cw_index}")
+        run.in_flight = 0
+
+
+def gui_submit_curve_run(cw_index):
+    run = curve_runs[cw_index]
+    
+    sources = gui_curve_sources(cw_index)
+    if not sources:
+        dpg.set_value(f"curve_run_checkbox_{cw_index}", False)
+        gui_toggle_curve_run(cw_index, False)
+        return
+    
+    encoding = OscilloscopeEncoding[dpg.get_value(f"curve_encoding_combo_{cw_index}")]
+    width = int(dpg.get_value(f"curve_width_combo_{cw_index}"))
+    
+    generation = run.generation
+    port = run.worker.ser.port
+    
+    def run_error(request, error):
+        gui_request_error(request, error, port)
+        
+        if run.running and run.generation == generation:
+            dpg.set_value(f"curve_run_checkbox_{cw_index}", False)
+            gui_toggle_curve_run(cw_index, False)
+            
+    def run_cancelled(request):
+        # Cancelled by someone else than the run itself, keep the same number of frames in flight
+        if run.running and run.generation == generation and not run.worker.stopped:
+            run.in_flight = run.in_flight - 1
+            gui_submit_curve_run(cw_index)
+    
+    run.in_flight = run.in_flight + 1
+    run.worker.submit(OscilloscopeCurvesRaw, sources, encoding, width, *gui_curve_range(cw_index), priority=OscilloscopeRequestPriority.Low, callback=lambda curves: gui_store_curve_run(cw_index, generation, sources, curves), error_callback=run_error, cancel_callback=run_cancelled, owner=f"curve_run_{cw_index}")
+    
+
+def gui_store_curve_run(cw_index, generation, sources, raw_curves):
+    run = curve_runs[cw_index]
+    
+    # A frame of a run that was stopped or restarted meanwhile
+    if not run.running or run.generation != generation:
+        return
+    
+    run.in_flight = run.in_flight - 1
+    
+    gui_store_curves(cw_index, gui_curve_frame(sources, raw_curves))
+    
+    # A frame that was never drawn is being replaced
+    if run.dirty:
+        run.dropped = run.dropped + 1
+    
+    run.dirty = True
+    run.acquired = run.acquired + 1
+    run.rate_count = run.rate_count + 1
+    
+    # Storing the frame may have completed an Average and stopped the run
+    if run.running:
+        gui_submit_curve_run(cw_index)
+        
+
+def gui_record_curves(cw_index, waveforms):
+    recorder = curve_recorders[cw_index]
+    if recorder is not None:
+        recorder.append(waveforms[0].timestamp, [(waveform.source, waveform.raw, waveform.preamble) for waveform in waveforms])
+        
+        # The writer stopped on an error, stop the recording now rather than dropping every capture until it is unchecked
+        if recorder.error is not None:
+            dpg.set_value(f"curve_record_checkbox_{cw_index}", False)
+            gui_toggle_curve_recording(cw_index, False)
+        
+        
+def gui_toggle_curve_recording(cw_index, recording):
+    def start_recording(sender, app_data):
+        path = os.path.join(app_data["file_path_name"], time.strftime("recording_%Y%m%d_%H%M%S"))
+        
+        curve_recorders[cw_index] = WaveformRecorder(path)
+        curve_recorders[cw_index].start()
+        
+        gui_add_to_log(f"-- Recording curve {cw_index} to {path}", LogLevel.Info)
+        
+    def cancel_recording(sender, app_data):
+        dpg.set_value(f"curve_record_checkbox_{cw_index}", False)
+    
+    if recording:
+        if dpg.does_item_exist("recording_dir_dialog"):
+            dpg.delete_item("recording_dir_dialog")
+        dpg.add_file_dialog(directory_selector=True, show=True, callback=start_recording, cancel_callback=cancel_recording, tag="recording_dir_dialog", width=700, height=400)
+    elif curve_recorders[cw_index] is not None:
+        recorder = curve_recorders[cw_index]
+        curve_recorders[cw_index] = None
+        
+        # Drains the queued captures on the writer thread
+        recorder.stop()
+        gui_add_to_log(f"-- Recorded {recorder.recorded} captures to {recorder.path}, {recorder.dropped} dropped", LogLevel.Info)
+        
+        if recorder.error is not None:
+            gui_add_to_log(f"!! Recording {recorder.path}: {recorder.error}", LogLevel.Error)
+
+
+def gui_process_curve_runs():
+    now = time.perf_counter()
+    
+    for cw_index, run in enumerate(curve_runs):
+        if not run.running and not run.dirty:
+            continue
+        
+        if now - run.rate_start >= 1.0:
+            run.rate = run.rate_count / (now - run.rate_start)
+            run.rate_start = now
+            run.rate_count = 0
+            
+            dpg.set_value(f"curve_run_stats_{cw_index}", f"{run.rate:.1f} wfm/s, {run.acquired} acquired, {run.dropped} dropped, {waveform_store.history_size(cw_index)} in history")
+            
+        if run.dirty and now - run.last_plot >= 1 / dpg.get_value(f"curve_run_fps_{cw_index}"):
+            run.dirty = False
+            run.last_plot = now
+            gui_update_curve_plot(cw_index)
+
+
 def gui_update_curve_plot(cw_index):
-    if dpg.get_value(f"curve_type_combo_{cw_index}") == CurveType.Oscilloscope.value:
+    view = CurveView(dpg.get_value(f"curve_view_combo_{cw_index}"))
+    
+    # Accumulated views are always in volts
+    oscilloscope_type = view == CurveView.Latest and dpg.get_value(f"curve_type_combo_{cw_index}") == CurveType.Oscilloscope.value
+    if oscilloscope_type:
         dpg.configure_item(f"y_curve_axis_{cw_index}", label="Read")
-        curve_type = 1
     else:
         dpg.configure_item(f"y_curve_axis_{cw_index}", label="Voltage [V]")
-        curve_type = 2
     
-    dpg.set_value(f"curve_series_1_{cw_index}", [acquisitions[cw_index][0][0], acquisitions[cw_index][0][curve_type]])
-    dpg.set_value(f"curve_series_2_{cw_index}", [acquisitions[cw_index][1][0], acquisitions[cw_index][1][curve_type]])
+    # The series only ever get a decimated envelope of the visible range, see gui_refresh_curve_lod
+    lod = curve_lods[cw_index]
+    lod.pyramids = {}
+    for source in OscilloscopeSource:
+        waveform = waveform_store.latest(cw_index, source.value)
+        if waveform is None:
+            continue
+        
+        if view == CurveView.Latest:
+            lod.pyramids[source.value] = DecimationPyramid(waveform.time, waveform.raw if oscilloscope_type else waveform.volts())
+            continue
+        
+        accumulator, _ = curve_accumulations[cw_index].accumulators.get(source.value, (None, None))
+        if view == CurveView.Persistence or accumulator is None or accumulator.count == 0 or accumulator.points != len(waveform):
+            continue
+        
+        if view == CurveView.Mean:
+            lod.pyramids[source.value] = DecimationPyramid(waveform.time, accumulator.mean)
+        elif view == CurveView.StandardDeviation:
+            lod.pyramids[source.value] = DecimationPyramid(waveform.time, accumulator.std)
+        else:
+            # Every sample is a vertical segment from its minimum to its maximum
+            lod.pyramids[source.value] = DecimationPyramid(np.repeat(waveform.time, 2), np.column_stack([accumulator.minimum, accumulator.maximum]).ravel())
+            
+    for source in OscilloscopeSource:
+        if source.value not in lod.pyramids:
+            dpg.configure_item(f"curve_series_{source.value}_{cw_index}", show=False)
+            
+    persistence = view == CurveView.Persistence and gui_update_curve_persistence(cw_index)
+    dpg.configure_item(f"curve_persistence_{cw_index}", show=persistence)
+    
+    if not lod.pyramids and not persistence:
+        return
     
-    dpg.fit_axis_data(f"x_curve_axis_{cw_index}")
+    # Fetching the zoomed in range keeps the user's view, the next capture follows it
+    zoom_fetch = dpg.get_value(f"curve_zoom_fetch_{cw_index}")
+    
+    x_range = None
+    if lod.pyramids:
+        x_range = (min(pyramid.x[0] for pyramid in lod.pyramids.values()), max(pyramid.x[-1] for pyramid in lod.pyramids.values()))
+    
+    # Only new sources, a new view or a new time base are fitted, a run must not undo the user's zoom on every frame
+    fit = (tuple(lod.pyramids), persistence, view, oscilloscope_type, None if zoom_fetch else x_range)
+    if fit != lod.fit:
+        lod.fit = fit
+        gui_fit_curve_plot(cw_index, x=not zoom_fetch)
+    elif lod.pyramids:
+        gui_refresh_curve_lod(cw_index, *dpg.get_axis_limits(f"x_curve_axis_{cw_index}"))
+    
+    if dpg.get_value(f"curve_measurements_header_{cw_index}"):
+        gui_update_curve_measurements(cw_index, refresh_history=False)
+        
+    if dpg.get_value(f"curve_spectrum_header_{cw_index}"):
+        gui_update_curve_spectrum(cw_index)
+        
+        
+def gui_update_curve_persistence(cw_index):
+    # Heat map of the first accumulated source, False if there is none
+    for source in OscilloscopeSource:
+        accumulator, _ = curve_accumulations[cw_index].accumulators.get(source.value, (None, None))
+        waveform = waveform_store.latest(cw_index, source.value)
+        
+        if accumulator is not None and accumulator.count and waveform is not None and len(waveform) == accumulator.points:
+            break
+    else:
+        return False
+    
+    persistence = accumulator.persistence()
+    
+    group = -(-accumulator.points // PERSISTENCE_COLUMNS)
+    columns = accumulator.points // group
+    persistence = persistence[:, :columns * group].reshape(accumulator.bins, columns, group).sum(axis=2)
+    
+    # Heat map rows are drawn from the top
+    values = persistence[::-1]
+    
+    time = waveform.time
+    dpg.configure_item(f"curve_persistence_{cw_index}", rows=accumulator.bins, cols=columns, bounds_min=(time[0], accumulator.y_min), bounds_max=(time[columns * group - 1], accumulator.y_max), scale_max=max(values.max(), 1e-12), label=f"{source.value} persistence")
+    dpg.set_value(f"curve_persistence_{cw_index}", [values.ravel()])
+    
+    return True
+    
+    
+class CurveLodState:
+    def __init__(self):
+        # Source -> DecimationPyramid of the sources captured so far
+        self.pyramids = {}
+        self.view = None
+        self.fitting = False
+        # What the axes were last fitted to, see gui_update_curve_plot
+        self.fit = None
+        
+curve_lods = []
+
+def gui_refresh_curve_lod(cw_index, x_min, x_max):
+    lod = curve_lods[cw_index]
+    pixels = max(dpg.get_item_rect_size(f"curve_plot_{cw_index}")[0], 100)
+    
+    for source, pyramid in lod.pyramids.items():
+        x, y = pyramid.envelope(x_min, x_max, pixels)
+        dpg.set_value(f"curve_series_{source}_{cw_index}", [x, y])
+        dpg.configure_item(f"curve_series_{source}_{cw_index}", show=True)
+        
+    lod.view = (x_min, x_max, pixels)
+    
+    
+def gui_fit_curve_plot(cw_index, x=True):
+    lod = curve_lods[cw_index]
+    
+    if lod.pyramids:
+        gui_refresh_curve_lod(cw_index, min(pyramid.x[0] for pyramid in lod.pyramids.values()), max(pyramid.x[-1] for pyramid in lod.pyramids.values()))
+    
+    # The axis limits only follow the fit after the next frame is rendered
+    lod.fitting = True
+    
+    if x:
+        dpg.fit_axis_data(f"x_curve_axis_{cw_index}")
     dpg.fit_axis_data(f"y_curve_axis_{cw_index}")
     
+    
+def gui_process_curve_lods():
+    # Zooming, panning or resizing a plot recomputes the envelope of what is visible
+    for cw_index, lod in enumerate(curve_lods):
+        if not lod.pyramids:
+            continue
+        
+        if lod.fitting:
+            lod.fitting = False
+            continue
+        
+        x_min, x_max = dpg.get_axis_limits(f"x_curve_axis_{cw_index}")
+        pixels = max(dpg.get_item_rect_size(f"curve_plot_{cw_index}")[0], 100)
+        
+        if lod.view != (x_min, x_max, pixels):
+            gui_refresh_curve_lod(cw_index, x_min, x_max)
+    
+    
+# Measuring the whole history takes tens of ms per source, a run only repeats it this often [s]
+CURVE_HISTORY_MEASUREMENT_INTERVAL = 1.0
+
+class CurveHistoryMeasurementState:
+    def __init__(self):
+        self.refreshed = None
+        # Source -> (results, number of waveforms measured)
+        self.results = {}
+        
+curve_history_measurements = []
+
+def gui_update_curve_measurements(cw_index, refresh_history=True):
+    types = list(HostMeasurementType)
+    
+    use_history = dpg.get_value(f"curve_measurements_history_{cw_index}")
+    state = curve_history_measurements[cw_index]
+    
+    # Without refresh_history the history is only measured again once the interval has passed
+    now = time.monotonic()
+    refresh_history = use_history and (refresh_history or state.refreshed is None or now - state.refreshed >= CURVE_HISTORY_MEASUREMENT_INTERVAL)
+    if refresh_history:
+        state.refreshed = now
+        state.results = {}
+    
+    for source in OscilloscopeSource:
+        waveform = waveform_store.latest(cw_index, source.value)
+        if waveform is None:
+            continue
+        
+        results = MeasureWaveforms(waveform.time, waveform.volts(), types)
+        
+        if refresh_history:
+            # Every stored waveform of the channel in one batch
+            time_axis, history = waveform_store.history_volts(cw_index, source.value)
+            if len(history) > 0:
+                state.results[source.value] = (MeasureWaveforms(time_axis, history, types), len(history))
+                
+        history_results, history_length = state.results.get(source.value, (None, 0)) if use_history else (None, 0)
+        
+        for type in types:
+            text = f"{results[type]:.4g} {HOST_MEASUREMENT_UNITS[type]}" if not np.isnan(results[type]) else "--"
+            if history_results is not None:
+                # e.g. no full period of a frequency in any capture
+                values = history_results[type][~np.isnan(history_results[type])]
+                text = f"{values.mean():.4g} +/- {values.std():.2g} {HOST_MEASUREMENT_UNITS[type]} ({len(values)}/{history_length})" if len(values) else "--"
+                
+            dpg.set_value(f"curve_measurement_{cw_index}_{source.value}_{type.value}", text)
+    
+
+SPECTRUM_SEGMENT_LENGTHS = ["RECORD", "2048", "1024", "512", "256"]
+
+def gui_update_curve_spectrum(cw_index):
+    window = SpectrumWindow[dpg.get_value(f"curve_spectrum_window_{cw_index}")]
+    use_history = dpg.get_value(f"curve_spectrum_history_{cw_index}")
+    segment = dpg.get_value(f"curve_spectrum_segment_{cw_index}")
+    segment_length = None if segment == "RECORD" else int(segment)
+    
+    if use_history:
+        dpg.configure_item(f"y_spectrum_axis_{cw_index}", label="PSD [dB V^2/Hz]")
+    else:
+        dpg.configure_item(f"y_spectrum_axis_{cw_index}", label="Amplitude [dBV]")
+    
+    shown = False
+    for source in OscilloscopeSource:
+        waveform = waveform_store.latest(cw_index, source.value)
+        if waveform is None or len(waveform) < 16:
+            dpg.configure_item(f"curve_spectrum_series_{source.value}_{cw_index}", show=False)
+            continue
+        
+        xincr = waveform.preamble.xincr
+        
+        if use_history:
+            # Welch average over the segments of every stored waveform of the source in one batch
+            _, volts = waveform_store.history_volts(cw_index, source.value)
+            if len(volts) == 0:
+                volts = waveform.volts()[np.newaxis]
+            
+            frequencies, density = WelchPowerSpectralDensity(volts, xincr, window, segment_length)
+            power = density * (frequencies[1] - frequencies[0])
+            with np.errstate(divide="ignore"):
+                values = 10 * np.log10(density)
+            count = f" ({len(volts)})"
+        else:
+            # One transform for both the readouts (power) and the plot (RMS amplitude of the tones)
+            frequencies, power = PowerSpectrum(waveform.volts(), xincr, window)
+            with np.errstate(divide="ignore"):
+                values = 10 * np.log10(power * SpectrumNoiseBandwidth(window, len(waveform)))
+            count = ""
+        
+        # Keep -inf (exact zeros) out of the axis fit
+        np.maximum(values, -300, out=values)
+        dpg.set_value(f"curve_spectrum_series_{source.value}_{cw_index}", [frequencies, values])
+        dpg.configure_item(f"curve_spectrum_series_{source.value}_{cw_index}", show=True)
+        shown = True
+        
+        metrics = SpectrumMetrics(frequencies, power, window)
+        dpg.set_value(f"curve_spectrum_{cw_index}_{source.value}_frequency", f"{metrics['frequency']:.6g} Hz{count}")
+        dpg.set_value(f"curve_spectrum_{cw_index}_{source.value}_amplitude", f"{metrics['amplitude']:.4g} V RMS")
+        dpg.set_value(f"curve_spectrum_{cw_index}_{source.value}_thd", f"{metrics['thd']:.3g} %")
+        dpg.set_value(f"curve_spectrum_{cw_index}_{source.value}_snr", f"{metrics['snr']:.3g} dB")
+    
+    if shown:
+        dpg.fit_axis_data(f"x_spectrum_axis_{cw_index}")
+        dpg.fit_axis_data(f"y_spectrum_axis_{cw_index}")
+    
 
 def gui_save_curve_plot(cw_index):
+    # Only needed for exports, keep it out of the startup path
+    from matplotlib import pyplot as plt
+    
     plt.close()
     
-    if dpg.get_value(f"curve_type_combo_{cw_index}") == CurveType.Oscilloscope.value:
+    oscilloscope_type = dpg.get_value(f"curve_type_combo_{cw_index}") == CurveType.Oscilloscope.value
+    if oscilloscope_type:
         plt.ylabel("Read")
-        curve_type = 1
     else:
         plt.ylabel("Voltage [V]")
-        curve_type = 2
         
-    plt.plot(acquisitions[cw_index][0][0], acquisitions[cw_index][0][curve_type], label="CH1")
-    plt.plot(acquisitions[cw_index][1][0], acquisitions[cw_index][1][curve_type], label="CH2")
+    for source in OscilloscopeSource:
+        waveform = waveform_store.latest(cw_index, source.value)
+        if waveform is not None:
+            plt.plot(waveform.time, waveform.raw if oscilloscope_type else waveform.volts(), label=source.value)
     
     plt.xlabel("Time [s]")
     plt.grid()
@@ -177,16 +1010,31 @@ def gui_save_curve_plot(cw_index):
         dpg.add_file_extension(".jpg")
 
 def gui_save_curve_csv(cw_index):
-    time = acquisitions[cw_index][0][0]
-    ch1_read =  acquisitions[cw_index][0][1]
-    ch2_read =  acquisitions[cw_index][1][1]
-    ch1_voltage =  acquisitions[cw_index][0][2]
-    ch2_voltage =  acquisitions[cw_index][1][2]
+    # CH1 and CH2 are always written, math and reference waveforms only once captured
+    sources = [source for source in OscilloscopeSource if source.value in ("CH1", "CH2") or waveform_store.latest(cw_index, source.value) is not None]
+    waveforms = [waveform_store.latest(cw_index, source.value) for source in sources]
+    captured = [waveform for waveform in waveforms if waveform is not None]
+    if not captured:
+        return
+    
+    time = captured[0].time
     
-    csv_array = np.asarray([time, ch1_read, ch2_read, ch1_voltage, ch2_voltage])
+    # A source missing or taken with another time base is left empty
+    reads = []
+    voltages = []
+    for waveform in waveforms:
+        if waveform is None or not np.array_equal(waveform.time, time):
+            reads.append(np.full(len(time), np.nan))
+            voltages.append(np.full(len(time), np.nan))
+        else:
+            reads.append(waveform.raw)
+            voltages.append(waveform.volts())
+    
+    csv_array = np.asarray([time] + reads + voltages)
+    header = ", ".join(["Time [s]"] + [f"Read {source.value}" for source in sources] + [f"Voltage {source.value} [V]" for source in sources])
     
     def save_file(sender, app_data):
-        np.savetxt(app_data["file_path_name"], csv_array.T, delimiter=",", header="Time [s], Read CH1, Read CH2, Voltage CH1 [V], Voltage CH2 [V    ]")
+        np.savetxt(app_data["file_path_name"], csv_array.T, delimiter=",", header=header)
     
     dpg.delete_item("csv_save_dialog")
     with dpg.file_dialog(directory_selector=False, show=True, callback=save_file, default_filename=f"curve_{cw_index}.csv", tag="csv_save_dialog", width=700 ,height=400):
@@ -194,34 +1042,6 @@ def gui_save_curve_csv(cw_index):
         dpg.add_file_extension(".csv")
         dpg.add_file_extension(".txt")
 
-dpg.create_context()
-dpg.create_viewport(title="TEK-232 Oscilloscope Utilities", clear_color=[239,228,208,255], large_icon="oscilloscope.jpg")
-dpg.setup_dearpygui()
-
-theme = create_theme_imgui_light()
-dpg.bind_theme(theme)
-
-width, height, channels, data = dpg.load_image("oscilloscope.jpg")
-
-with dpg.texture_registry(show=False):
-    dpg.add_static_texture(width=width, height=height, default_value=data, tag="bg_texture")
-
-with dpg.window(label="USBTMC Configuration", tag="usbtmc_file_window", width=430, height=400, no_resize=True, no_close=True):
-    dpg.add_input_text(label="USBTMC file", tag="usbtmc_file_input")
-    
-    with dpg.group(horizontal=True):
-        dpg.add_button(label="Connect", callback=gui_rs232_connect)
-        
-    dpg.add_image("bg_texture")
-
-    
-with dpg.window(label="Oscilloscope commands", show=False, tag="oscilloscope_commands_window", pos=(400,0), no_close=True):
-    dpg.add_button(label="Id", callback=lambda _: OscilloscopeId(ser))
-    dpg.add_button(label="New immediate measurement", callback=lambda _: CreateMeasurementWindow())
-    dpg.add_button(label="New curve acquisition", callback=lambda _: CreateCurveWindow())
-    dpg.add_button(label="Events and errors log", callback=lambda _: OscilloscopeAlle(ser))
-
-
 measurement_window_index = -1
 def CreateMeasurementWindow():
     global measurement_window_index
@@ -232,10 +1052,11 @@ def CreateMeasurementWindow():
     new_pos = [0,0]
     if mw_index != 0:
         new_pos = dpg.get_item_pos(f"measurement_window_{mw_index - 1}")
-        new_pos[1] += 130
+        new_pos[1] += 155
     
-    with dpg.window(label=f"Measurement {mw_index}", show=True, tag=f"measurement_window_{mw_index}", height=130, width=250, pos=new_pos, no_resize=True, no_scrollbar=True):
+    with dpg.window(label=f"Measurement {mw_index}", show=True, tag=f"measurement_window_{mw_index}", height=155, width=250, pos=new_pos, no_resize=True, no_scrollbar=True):
         
+        gui_add_instrument_combo(f"measurement_instrument_combo_{mw_index}")
         dpg.add_combo(items=[e.value for e in OscilloscopeChannel], label="Channel", tag=f"measurement_channel_combo_{mw_index}", default_value="CH1")
         dpg.add_combo(items=[e.value for e in OscilloscopeMeasurementType], label="Type", tag=f"measurement_type_combo_{mw_index}", default_value="PK2PK")
         
@@ -245,11 +1066,48 @@ def CreateMeasurementWindow():
             dpg.add_input_text(default_value="--", tag=f"measurement_text_{mw_index}", readonly=True)
             dpg.add_button(label="Measure", callback=lambda _: gui_immediate_measurement(mw_index))
 
-        dpg.add_button(label="Copy to clipboard", callback=lambda _: pyperclip.copy(dpg.get_value(f"measurement_text_{mw_index}")))
+        dpg.add_button(label="Copy to clipboard", callback=lambda _: gui_copy_to_clipboard(dpg.get_value(f"measurement_text_{mw_index}")))
             
 
+measurement_table_index = -1
+def CreateMeasurementTableWindow():
+    global measurement_table_index
+    measurement_table_index = measurement_table_index + 1
+    
+    mt_index = measurement_table_index
+    
+    measurement_tables.append(MeasurementTableState())
+    
+    with dpg.window(label=f"Measurement table {mt_index}", show=True, tag=f"measurement_table_window_{mt_index}", width=420, height=360, pos=(250, 30 * mt_index)):
+        
+        gui_add_instrument_combo(f"measurement_table_instrument_combo_{mt_index}", width=200)
+        
+        with dpg.group(horizontal=True):
+            dpg.add_button(label="Refresh", callback=lambda _: gui_measurement_table_refresh(mt_index))
+            dpg.add_checkbox(label="Auto", tag=f"measurement_table_auto_{mt_index}")
+            dpg.add_input_float(label="Interval [s]", tag=f"measurement_table_interval_{mt_index}", default_value=1.0, min_value=0.05, min_clamped=True, step=0.5, width=100)
+            
+        dpg.add_separator()
+        
+        with dpg.table(header_row=True, borders_innerH=True, borders_outerH=True, borders_innerV=True, borders_outerV=True):
+            dpg.add_table_column(label="", width_fixed=True)
+            dpg.add_table_column(label="Channel")
+            dpg.add_table_column(label="Type")
+            dpg.add_table_column(label="Value")
+            dpg.add_table_column(label="Unit")
+            
+            for channel in OscilloscopeChannel:
+                for type in OscilloscopeMeasurementType:
+                    with dpg.table_row():
+                        dpg.add_checkbox(tag=f"measurement_table_enabled_{mt_index}_{channel.value}_{type.value}", default_value=True)
+                        dpg.add_text(channel.value)
+                        dpg.add_text(type.value)
+                        dpg.add_text("--", tag=f"measurement_table_value_{mt_index}_{channel.value}_{type.value}")
+                        dpg.add_text("", tag=f"measurement_table_unit_{mt_index}_{channel.value}_{type.value}")
+                        
+
 curve_window_index = -1
-def CreateCurveWindow():
+def CreateCurveWindow(port=None):
     global curve_window_index
     curve_window_index = curve_window_index + 1
     
@@ -261,20 +1119,57 @@ def CreateCurveWindow():
         new_pos[1] += 400
         
         
-    acquisitions.append([
-            [[0], [0]],
-            [[0], [0]]
-        ])
+    curve_runs.append(CurveRunState())
+    curve_recorders.append(None)
+    curve_lods.append(CurveLodState())
+    curve_history_measurements.append(CurveHistoryMeasurementState())
+    curve_accumulations.append(CurveAccumulationState())
     
     with dpg.window(label=f"Curve {cw_index}", show=True, tag=f"curve_window_{cw_index}", min_size=(550,400), pos=new_pos, no_resize=False, no_scrollbar=True):
         
+        gui_add_instrument_combo(f"curve_instrument_combo_{cw_index}", width=200, callback=lambda _: gui_bind_curve_window(cw_index))
+        if port is not None:
+            dpg.set_value(f"curve_instrument_combo_{cw_index}", port)
+        
         with dpg.group(horizontal=True):
-            dpg.add_button(label="Capture both", callback=lambda _: gui_curve_acquisition(cw_index, [OscilloscopeChannel.CH1, OscilloscopeChannel.CH2]))
+            dpg.add_button(label="Capture", callback=lambda _: gui_curve_acquisition(cw_index, gui_curve_sources(cw_index)))
+            
+            for source in OscilloscopeSource:
+                dpg.add_checkbox(label=source.value, tag=f"curve_source_checkbox_{cw_index}_{source.value}", default_value=source.value in ("CH1", "CH2"))
             
             dpg.add_spacer()
             
-            dpg.add_button(label="Capture CH1", callback=lambda _: gui_curve_acquisition(cw_index, [OscilloscopeChannel.CH1]))
-            dpg.add_button(label="Capture CH2", callback=lambda _: gui_curve_acquisition(cw_index, [OscilloscopeChannel.CH2]))
+            dpg.add_button(label="Capture CH1", callback=lambda _: gui_curve_acquisition(cw_index, [OscilloscopeSource.CH1]))
+            dpg.add_button(label="Capture CH2", callback=lambda _: gui_curve_acquisition(cw_index, [OscilloscopeSource.CH2]))
+            
+            dpg.add_spacer()
+            
+            dpg.add_button(label="Cancel", callback=lambda _: gui_cancel_curve_acquisition(cw_index))
+            
+        with dpg.group(horizontal=True):
+            dpg.add_checkbox(label="Run", tag=f"curve_run_checkbox_{cw_index}", callback=lambda _, running: gui_toggle_curve_run(cw_index, running))
+            dpg.add_input_int(label="Plot FPS", tag=f"curve_run_fps_{cw_index}", default_value=20, min_value=1, max_value=120, min_clamped=True, max_clamped=True, width=80)
+            dpg.add_checkbox(label="Record", tag=f"curve_record_checkbox_{cw_index}", callback=lambda _, recording: gui_toggle_curve_recording(cw_index, recording))
+            dpg.add_text("", tag=f"curve_run_stats_{cw_index}")
+            
+        with dpg.group(horizontal=True):
+            dpg.add_input_int(label="History", tag=f"curve_history_input_{cw_index}", default_value=CURVE_HISTORY_LENGTH, min_value=0, min_clamped=True, step=64, width=100)
+            dpg.add_button(label="Clear history", callback=lambda _: gui_clear_curve_history(cw_index))
+            
+        with dpg.group(horizontal=True):
+            dpg.add_input_int(label="Start", tag=f"curve_start_input_{cw_index}", default_value=1, min_value=1, max_value=OSCILLOSCOPE_RECORD_LENGTH, min_clamped=True, max_clamped=True, step=0, width=60)
+            dpg.add_input_int(label="Stop", tag=f"curve_stop_input_{cw_index}", default_value=OSCILLOSCOPE_RECORD_LENGTH, min_value=1, max_value=OSCILLOSCOPE_RECORD_LENGTH, min_clamped=True, max_clamped=True, step=0, width=60)
+            dpg.add_input_int(label="Stride", tag=f"curve_stride_input_{cw_index}", default_value=1, min_value=1, max_value=OSCILLOSCOPE_RECORD_LENGTH, min_clamped=True, max_clamped=True, width=80)
+            dpg.add_checkbox(label="Fetch zoom", tag=f"curve_zoom_fetch_{cw_index}")
+            dpg.add_button(label="Full record", callback=lambda _: gui_reset_curve_range(cw_index))
+            dpg.add_button(label="Fit", callback=lambda _: gui_fit_curve_plot(cw_index))
+            
+        with dpg.group(horizontal=True):
+            dpg.add_combo(items=[e.name for e in AccumulationMode], default_value=AccumulationMode.Off.name, label="Accumulate", tag=f"curve_accumulation_combo_{cw_index}", width=90, callback=lambda _: gui_reset_curve_accumulation(cw_index))
+            dpg.add_input_int(label="N", tag=f"curve_accumulation_count_{cw_index}", default_value=CURVE_ACCUMULATION_COUNT, min_value=1, min_clamped=True, width=90)
+            dpg.add_combo(items=[e.value for e in CurveView], default_value=CurveView.Latest.value, label="View", tag=f"curve_view_combo_{cw_index}", width=110, callback=lambda _: gui_update_curve_plot(cw_index))
+            dpg.add_button(label="Reset", callback=lambda _: gui_reset_curve_accumulation(cw_index))
+            dpg.add_text("", tag=f"curve_accumulation_status_{cw_index}")
             
         with dpg.group(horizontal=True):
             dpg.add_button(label="Export CSV", callback= lambda _: gui_save_curve_csv(cw_index))
@@ -282,41 +1177,180 @@ def CreateCurveWindow():
         
         dpg.add_separator()
         
+        with dpg.collapsing_header(label="Measurements", tag=f"curve_measurements_header_{cw_index}", default_open=False):
+            dpg.add_checkbox(label="Over run history", tag=f"curve_measurements_history_{cw_index}", callback=lambda _: gui_update_curve_measurements(cw_index))
+            
+            with dpg.table(header_row=True, borders_innerH=True, borders_outerH=True, borders_innerV=True, borders_outerV=True):
+                dpg.add_table_column(label="Type", width_fixed=True)
+                for source in OscilloscopeSource:
+                    dpg.add_table_column(label=source.value)
+                
+                for type in HostMeasurementType:
+                    with dpg.table_row():
+                        dpg.add_text(type.value)
+                        for source in OscilloscopeSource:
+                            dpg.add_text("--", tag=f"curve_measurement_{cw_index}_{source.value}_{type.value}")
+                            
+        with dpg.collapsing_header(label="Spectrum", tag=f"curve_spectrum_header_{cw_index}", default_open=False):
+            with dpg.group(horizontal=True):
+                dpg.add_combo(items=[e.name for e in SpectrumWindow], default_value=SpectrumWindow.BlackmanHarris.name, label="Window", tag=f"curve_spectrum_window_{cw_index}", width=130, callback=lambda _: gui_update_curve_spectrum(cw_index))
+                dpg.add_checkbox(label="Welch over run history", tag=f"curve_spectrum_history_{cw_index}", callback=lambda _: gui_update_curve_spectrum(cw_index))
+                dpg.add_combo(items=SPECTRUM_SEGMENT_LENGTHS, default_value="RECORD", label="Segment", tag=f"curve_spectrum_segment_{cw_index}", width=80, callback=lambda _: gui_update_curve_spectrum(cw_index))
+                
+            with dpg.table(header_row=True, borders_innerH=True, borders_outerH=True, borders_innerV=True, borders_outerV=True):
+                dpg.add_table_column(label="Type", width_fixed=True)
+                for source in OscilloscopeSource:
+                    dpg.add_table_column(label=source.value)
+                
+                for type, label in (("frequency", "Peak"), ("amplitude", "Amplitude"), ("thd", "THD"), ("snr", "SNR")):
+                    with dpg.table_row():
+                        dpg.add_text(label)
+                        for source in OscilloscopeSource:
+                            dpg.add_text("--", tag=f"curve_spectrum_{cw_index}_{source.value}_{type}")
+                            
+            with dpg.plot(label="Spectrum", height=250, width=-1, tag=f"curve_spectrum_plot_{cw_index}"):
+                dpg.add_plot_legend()
+                
+                dpg.add_plot_axis(dpg.mvXAxis, label="Frequency [Hz]", tag=f"x_spectrum_axis_{cw_index}")
+                dpg.add_plot_axis(dpg.mvYAxis, label="Amplitude [dBV]", tag=f"y_spectrum_axis_{cw_index}")
+                
+                for source in OscilloscopeSource:
+                    dpg.add_line_series([0], [0], parent=f"y_spectrum_axis_{cw_index}", tag=f"curve_spectrum_series_{source.value}_{cw_index}", label=source.value, show=False)
+        
         with dpg.group(horizontal=True):
             dpg.add_combo(items=[e.value for e in CurveType], default_value="OSCILLOSCOPE", tag=f"curve_type_combo_{cw_index}", callback=lambda _: gui_update_curve_plot(cw_index))
+            dpg.add_combo(items=[e.name for e in OscilloscopeEncoding], default_value="RIBinary", tag=f"curve_encoding_combo_{cw_index}", width=100)
+            dpg.add_combo(items=["1", "2"], default_value="2", tag=f"curve_width_combo_{cw_index}", width=40)
 
         
-        with dpg.plot(label="Oscilloscope acquisition", height=-1, width=-1):
+        with dpg.plot(label="Oscilloscope acquisition", height=-1, width=-1, tag=f"curve_plot_{cw_index}"):
             dpg.add_plot_legend()
 
             dpg.add_plot_axis(dpg.mvXAxis, label="Time [s]", tag=f"x_curve_axis_{cw_index}")
             dpg.add_plot_axis(dpg.mvYAxis, label="Read", tag=f"y_curve_axis_{cw_index}")
             
-            dpg.add_line_series([0], [0], parent=f"y_curve_axis_{cw_index}", tag=f"curve_series_1_{cw_index}", label="CH1")
-            dpg.add_line_series([0], [0], parent=f"y_curve_axis_{cw_index}", tag=f"curve_series_2_{cw_index}", label="CH2")
+            dpg.add_heat_series([0.0], 1, 1, parent=f"y_curve_axis_{cw_index}", tag=f"curve_persistence_{cw_index}", format="", show=False)
+            
+            # Shown once their source is captured
+            for source in OscilloscopeSource:
+                dpg.add_line_series([0], [0], parent=f"y_curve_axis_{cw_index}", tag=f"curve_series_{source.value}_{cw_index}", label=source.value, show=False)
             
     
             
 
-with dpg.window(label="Communication log", show=False, tag="communication_log_window", no_close=True, min_size=(400, 240)):
-    def toggle_auto_scroll(checkbox, checked):
-        dpg.configure_item("communication_log_text", tracked=checked)
+def gui_process_frame():
+    for instrument in list(instruments.values()):
+        instrument.worker.process_results()
+        
+    gui_process_curve_runs()
+    gui_process_curve_lods()
+    gui_process_measurement_tables()
+    gui_process_performance()
+    gui_flush_log()
     
-    dpg.add_checkbox(label="Autoscroll", default_value=True, callback=toggle_auto_scroll)
+
+def main():
+    dpg.create_context()
+    dpg.create_viewport(title="TEK-232 Oscilloscope Utilities", clear_color=[239,228,208,255], large_icon="oscilloscope.jpg")
+    dpg.setup_dearpygui()
+
+    theme = create_theme_imgui_light()
+    dpg.bind_theme(theme)
+
+    width, height, channels, data = dpg.load_image("oscilloscope.jpg")
+
+    with dpg.texture_registry(show=False):
+        dpg.add_static_texture(width=width, height=height, default_value=data, tag="bg_texture")
+
+    with dpg.window(label="USBTMC Configuration", tag="usbtmc_file_window", width=430, height=400, no_resize=True, no_close=True):
+        dpg.add_input_text(label="USBTMC file", tag="usbtmc_file_input")
+        dpg.add_input_float(label="Timeout [s]", tag="usbtmc_timeout_input", default_value=2.0, min_value=0.1, min_clamped=True, step=0.5)
+        dpg.add_input_float(label="Preamble cache [s]", tag="usbtmc_preamble_age_input", default_value=1.0, min_value=0.0, min_clamped=True, step=0.5)
+        dpg.add_input_int(label="History memory [MB]", default_value=waveform_store.memory_limit >> 20, min_value=1, min_clamped=True, step=64, callback=lambda _, megabytes: gui_set_history_memory(megabytes))
     
-    with dpg.child_window():
-        dpg.add_input_text(tag="communication_log_text", multiline=True, readonly=True, tracked=True, track_offset=1, width=-1, height=0)
+        with dpg.group(horizontal=True):
+            dpg.add_button(label="Connect", callback=gui_rs232_connect)
+        
+        dpg.add_image("bg_texture")
+
     
-with dpg.window(label="About", no_close=True, no_resize=True, pos=(0, 400)):
-    dpg.add_text("Developed by Achille Merendino in 2024")
-    dpg.add_button(label="Visit my homepage", callback=lambda: webbrowser.open("https://achilleme.com"))
+    with dpg.window(label="Oscilloscope commands", show=False, tag="oscilloscope_commands_window", pos=(400,0), no_close=True):
+        instrument_combos.append("instrument_combo")
+        dpg.add_combo(items=[], label="Instrument", tag="instrument_combo", width=200)
+        
+        with dpg.group(horizontal=True):
+            dpg.add_button(label="Connect another", callback=lambda _: dpg.configure_item("usbtmc_file_window", show=True))
+            dpg.add_button(label="Disconnect", callback=lambda _: gui_disconnect_instrument(dpg.get_value("instrument_combo")))
+        
+        dpg.add_button(label="Id", callback=lambda _: gui_submit_command(OscilloscopeId))
+        dpg.add_button(label="Reconnect", callback=lambda _: gui_rs232_reconnect())
+        dpg.add_button(label="Forget cached settings", callback=lambda _: gui_submit_command(OscilloscopeSession.invalidate_settings))
+        dpg.add_button(label="Forget cached preambles", callback=lambda _: gui_submit_command(OscilloscopeSession.invalidate_preambles))
+        dpg.add_button(label="New immediate measurement", callback=lambda _: CreateMeasurementWindow())
+        dpg.add_button(label="New measurement table", callback=lambda _: CreateMeasurementTableWindow())
+        dpg.add_button(label="New curve acquisition", callback=lambda _: CreateCurveWindow())
+        dpg.add_button(label="Events and errors log", callback=lambda _: gui_submit_command(OscilloscopeAlle))
+        dpg.add_button(label="Capture all instruments", callback=lambda _: gui_capture_all_instruments())
+        dpg.add_button(label="Command performance", callback=lambda _: dpg.configure_item("performance_window", show=True))
+
+
+    with dpg.window(label="Communication log", show=False, tag="communication_log_window", no_close=True, min_size=(400, 240)):
+        def toggle_auto_scroll(checkbox, checked):
+            dpg.configure_item("communication_log_text", tracked=checked)
+    
+        with dpg.group(horizontal=True):
+            dpg.add_checkbox(label="Autoscroll", default_value=True, callback=toggle_auto_scroll)
+            dpg.add_combo(items=[e.name for e in LogLevel], label="Level", default_value=LogLevel.Verbose.name, width=80, callback=lambda _, level_name: gui_set_log_level(level_name))
+            dpg.add_button(label="Clear", callback=lambda _: gui_clear_log())
+        
+        with dpg.group(horizontal=True):
+            dpg.add_input_int(label="Capacity", default_value=5000, min_value=10, min_clamped=True, step=1000, width=100, on_enter=True, callback=lambda _, capacity: gui_set_log_capacity(capacity))
+            dpg.add_input_int(label="Visible lines", tag="communication_log_visible_input", default_value=200, min_value=10, min_clamped=True, step=50, width=100, callback=lambda _: gui_flush_log(force=True))
+    
+        with dpg.child_window():
+            dpg.add_input_text(tag="communication_log_text", multiline=True, readonly=True, tracked=True, track_offset=1, width=-1, height=0)
     
-    dpg.add_separator()
+    with dpg.window(label="Command performance", show=False, tag="performance_window", width=760, height=300, pos=(250, 300)):
+        with dpg.group(horizontal=True):
+            dpg.add_checkbox(label="Enabled", callback=lambda _, enabled: gui_set_profiling(enabled))
+            dpg.add_button(label="Reset", callback=lambda _: command_profiler.reset())
+            dpg.add_button(label="Export timings", callback=lambda _: gui_export_command_timings())
+            dpg.add_text("", tag="performance_summary_text")
+            
+        with dpg.table(tag="performance_table", header_row=True, borders_innerH=True, borders_outerH=True, borders_innerV=True, borders_outerV=True, resizable=True):
+            dpg.add_table_column(label="Command")
+            for label in ["Calls", "Calls/s", "Read [kB/s]", "First byte p50 [ms]", "p50 [ms]", "p90 [ms]", "p99 [ms]", "Parse p50 [ms]"]:
+                dpg.add_table_column(label=label, width_fixed=True)
     
-    dpg.add_text("Based on the following documents")
-    dpg.add_button(label="TEK232 Documents", callback=lambda: webbrowser.open("https://achilleme.com/tek232"))
+    with dpg.window(label="About", no_close=True, no_resize=True, pos=(0, 400)):
+        dpg.add_text("Developed by Achille Merendino in 2024")
+        dpg.add_button(label="Visit my homepage", callback=lambda: webbrowser.open("https://achilleme.com"))
     
+        dpg.add_separator()
+    
+        dpg.add_text("Based on the following documents")
+        dpg.add_button(label="TEK232 Documents", callback=lambda: webbrowser.open("https://achilleme.com/tek232"))
+    
+
+    dpg.show_viewport()
+
+    while dpg.is_dearpygui_running():
+        gui_process_frame()
+        dpg.render_dearpygui_frame()
+    
+    # Runs and recordings are stopped while their widgets still exist
+    for instrument in instruments.values():
+        gui_stop_curve_runs(instrument.worker)
+        instrument.worker.stop()
+        instrument.ser.close()
+        
+    for cw_index, recorder in enumerate(curve_recorders):
+        if recorder is not None:
+            curve_recorders[cw_index] = None
+            recorder.stop()
+            
+    dpg.destroy_context()
+
 
-dpg.show_viewport()
-dpg.start_dearpygui()
-dpg.destroy_context()
+if __name__ == "__main__":
+    main()
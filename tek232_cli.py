@@ -0,0 +1,208 @@
+import sys
+import time
+import argparse
+import numpy as np
+from oscilloscope import (
+    OscilloscopeChannel,
+    OscilloscopeSource,
+    OscilloscopeMeasurementType,
+    OscilloscopeEncoding,
+    OscilloscopeSession,
+    OscilloscopeId,
+    OscilloscopeMeasureTable,
+    OscilloscopeCurvesRaw,
+    OSCILLOSCOPE_RECORD_LENGTH,
+)
+from recording import WaveformRecorder
+from instrumentation import CommandProfiler
+
+
+def ParseChannel(value):
+    return OscilloscopeChannel(value.upper())
+
+
+def ParseSource(value):
+    return OscilloscopeSource(value.upper())
+
+
+def ParsePositiveInt(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+
+    return number
+
+
+def ParseNonNegativeInt(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is negative")
+
+    return number
+
+
+def ParseMeasurementType(value):
+    for type in OscilloscopeMeasurementType:
+        if value.upper() in (type.value, type.name.upper()):
+            return type
+
+    raise argparse.ArgumentTypeError(f"unknown measurement type {value}")
+
+
+def ParseEncoding(value):
+    for encoding in OscilloscopeEncoding:
+        if value.upper() == encoding.name.upper():
+            return encoding
+
+    raise argparse.ArgumentTypeError(f"unknown encoding {value}")
+
+
+def CommandId(ser, args):
+    print(OscilloscopeId(ser).strip())
+
+
+def CommandCapture(ser, args):
+    channels = args.ch or [OscilloscopeSource.CH1]
+
+    raw = {}
+    scales = {channel: np.empty((args.count, 3)) for channel in channels}
+    timestamps = np.empty(args.count)
+    time_axis = None
+
+    last_report = time.monotonic()
+    for i in range(args.count):
+        timestamps[i] = time.time()
+
+        for channel, (points, preamble) in zip(channels, OscilloscopeCurvesRaw(ser, channels, args.encoding, args.width, args.start, args.stop, args.stride)):
+            if channel not in raw:
+                raw[channel] = np.empty((args.count, len(points)), dtype=points.dtype.newbyteorder("="))
+                time_axis = preamble.time[:len(points)]
+
+            raw[channel][i] = points
+            scales[channel][i] = (preamble.ymult, preamble.yoff, preamble.yzero)
+
+        if time.monotonic() - last_report >= 1.0 or i == args.count - 1:
+            last_report = time.monotonic()
+            print(f"{i + 1}/{args.count} captures", file=sys.stderr)
+
+    # volts = (raw - yoff) * ymult + yzero, with the scales of each capture
+    arrays = {"time": time_axis, "timestamps": timestamps}
+    for channel in channels:
+        arrays[channel.value] = raw[channel]
+        arrays[f"{channel.value}_scale"] = scales[channel]
+
+    np.savez(args.out, **arrays)
+
+
+def CommandRecord(ser, args):
+    channels = args.ch or [OscilloscopeSource.CH1]
+
+    recorder = WaveformRecorder(args.out)
+    recorder.start()
+
+    try:
+        i = 0
+        while args.count == 0 or i < args.count:
+            # The writer stopped on an error, the captures would only be dropped
+            if recorder.error is not None:
+                break
+
+            timestamp = time.time()
+            curves = OscilloscopeCurvesRaw(ser, channels, args.encoding, args.width, args.start, args.stop, args.stride)
+            recorder.append(timestamp, [(channel.value, points, preamble) for channel, (points, preamble) in zip(channels, curves)])
+            i = i + 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.stop()
+        print(f"{recorder.recorded} captures recorded to {args.out}, {recorder.dropped} dropped", file=sys.stderr)
+
+    if recorder.error is not None:
+        sys.exit(f"Recording to {args.out} failed: {recorder.error}")
+
+
+def CommandMeasure(ser, args):
+    channels = args.ch or [OscilloscopeChannel.CH1]
+    types = args.type or [OscilloscopeMeasurementType.PeakToPeak]
+    measurements = [(channel, type) for channel in channels for type in types]
+
+    for i in range(args.count):
+        if i != 0:
+            time.sleep(args.interval)
+
+        results = OscilloscopeMeasureTable(ser, measurements)
+
+        if i == 0:
+            print(",".join(["timestamp"] + [f"{channel.value} {type.value} [{unit}]" for (channel, type), (_, unit) in zip(measurements, results)]))
+
+        print(",".join([f"{time.time():.3f}"] + [value for value, _ in results]), flush=True)
+
+
+def PrintProfile(profiler):
+    print(f"{'Command':<32}{'calls':>8}{'kB/s':>10}{'p50 [ms]':>10}{'p99 [ms]':>10}{'parse [ms]':>12}", file=sys.stderr)
+
+    for row in profiler.report():
+        print(f"{row['command'][:31]:<32}{row['calls']:>8}{row['throughput'] / 1e3:>10.1f}{row['total_p50'] * 1e3:>10.3f}{row['total_p99'] * 1e3:>10.3f}{row['parse_p50'] * 1e3:>12.3f}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="tek232", description="Unattended acquisition from a TEK oscilloscope")
+    parser.add_argument("--port", default="/dev/usbtmc0", help="USBTMC device file")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Read timeout [s]")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print every command to stderr")
+    parser.add_argument("--profile", metavar="CSV", help="Time every command, print a summary to stderr and write the raw timings to CSV")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("id", help="Print the instrument identification")
+
+    capture_parser = subparsers.add_parser("capture", help="Capture curves into an .npz file")
+    capture_parser.add_argument("--ch", type=ParseSource, action="append", help="Source (CH1, CH2, MATH, REFA, REFB), repeat for several (default CH1)")
+    capture_parser.add_argument("--count", type=ParsePositiveInt, default=1, help="Number of captures")
+    capture_parser.add_argument("--encoding", type=ParseEncoding, default=OscilloscopeEncoding.RIBinary, help="Curve encoding (default RIBinary)")
+    capture_parser.add_argument("--width", type=int, choices=[1, 2], default=2, help="Bytes per point")
+    capture_parser.add_argument("--start", type=ParsePositiveInt, default=1, help="First record point (default 1)")
+    capture_parser.add_argument("--stop", type=ParsePositiveInt, default=OSCILLOSCOPE_RECORD_LENGTH, help=f"Last record point (default {OSCILLOSCOPE_RECORD_LENGTH})")
+    capture_parser.add_argument("--stride", type=ParsePositiveInt, default=1, help="Keep every stride-th point, the whole range is still transferred")
+    capture_parser.add_argument("--out", required=True, help="Output .npz file")
+
+    record_parser = subparsers.add_parser("record", help="Stream captures into a recording directory")
+    record_parser.add_argument("--ch", type=ParseSource, action="append", help="Source (CH1, CH2, MATH, REFA, REFB), repeat for several (default CH1)")
+    record_parser.add_argument("--count", type=ParseNonNegativeInt, default=0, help="Number of captures, 0 records until interrupted")
+    record_parser.add_argument("--encoding", type=ParseEncoding, default=OscilloscopeEncoding.RIBinary, help="Curve encoding (default RIBinary)")
+    record_parser.add_argument("--width", type=int, choices=[1, 2], default=2, help="Bytes per point")
+    record_parser.add_argument("--start", type=ParsePositiveInt, default=1, help="First record point (default 1)")
+    record_parser.add_argument("--stop", type=ParsePositiveInt, default=OSCILLOSCOPE_RECORD_LENGTH, help=f"Last record point (default {OSCILLOSCOPE_RECORD_LENGTH})")
+    record_parser.add_argument("--stride", type=ParsePositiveInt, default=1, help="Keep every stride-th point, the whole range is still transferred")
+    record_parser.add_argument("--out", required=True, help="Output directory")
+
+    measure_parser = subparsers.add_parser("measure", help="Print immediate measurements as CSV")
+    measure_parser.add_argument("--ch", type=ParseChannel, action="append", help="Channel, repeat for several (default CH1)")
+    measure_parser.add_argument("--type", type=ParseMeasurementType, action="append", help="Measurement type, repeat for several (default PK2PK)")
+    measure_parser.add_argument("--count", type=ParsePositiveInt, default=1, help="Number of readings")
+    measure_parser.add_argument("--interval", type=float, default=1.0, help="Time between readings [s]")
+
+    args = parser.parse_args(argv)
+
+    if args.command in ("capture", "record") and args.stop < args.start:
+        parser.error(f"--stop {args.stop} is before --start {args.start}")
+
+    log = (lambda message, level: print(message, file=sys.stderr)) if args.verbose else None
+
+    profiler = CommandProfiler() if args.profile else None
+
+    ser = OscilloscopeSession(args.port, timeout=args.timeout, log=log, profiler=profiler)
+    ser.open()
+
+    try:
+        {"id": CommandId, "capture": CommandCapture, "record": CommandRecord, "measure": CommandMeasure}[args.command](ser, args)
+    finally:
+        ser.close()
+
+        if profiler is not None:
+            profiler.export_csv(args.profile)
+            PrintProfile(profiler)
+
+
+if __name__ == "__main__":
+    main()
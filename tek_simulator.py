@@ -0,0 +1,342 @@
+import os
+import tty
+import time
+import argparse
+import threading
+import numpy as np
+
+
+# (short form, long form) of the mnemonics understood by the simulator
+MNEMONICS = [
+    ("DAT", "DATA"), ("ENC", "ENCDG"), ("SOU", "SOURCE"), ("STAR", "START"), ("STOP", "STOP"), ("WID", "WIDTH"),
+    ("CURV", "CURVE"), ("WFMP", "WFMPRE"), ("WFI", "WFID"), ("MEASU", "MEASUREMENT"), ("IMM", "IMMED"),
+    ("TYP", "TYPE"), ("VAL", "VALUE"), ("UNI", "UNITS"), ("ALLE", "ALLEV"), ("HEAD", "HEADER"),
+    ("HOR", "HORIZONTAL"), ("MAI", "MAIN"), ("SCA", "SCALE"), ("VOL", "VOLTS"),
+    ("BYT_N", "BYT_NR"), ("BIT_N", "BIT_NR"), ("BN_F", "BN_FMT"), ("BYT_O", "BYT_OR"), ("NR_P", "NR_PT"),
+    ("PT_F", "PT_FMT"), ("XIN", "XINCR"), ("PT_O", "PT_OFF"), ("XZE", "XZERO"), ("XUN", "XUNIT"),
+    ("YMU", "YMULT"), ("YZE", "YZERO"), ("YOF", "YOFF"), ("YUN", "YUNIT"),
+    ("ASCI", "ASCII"), ("RIB", "RIBINARY"), ("RPB", "RPBINARY"), ("SRI", "SRIBINARY"), ("SRP", "SRPBINARY"),
+]
+
+PREAMBLE_FIELDS = ["BYT_N", "BIT_N", "ENC", "BN_F", "BYT_O", "NR_P", "WFI", "PT_F", "XIN", "PT_O", "XZE", "XUN", "YMU", "YZE", "YOF", "YUN"]
+
+RECORD_LENGTH = 2500
+
+# Digitizer levels per vertical division with 1 byte per point
+LEVELS_PER_DIV = 25
+
+DEFAULT_SETTINGS = {
+    "DAT:ENC": "RIB",
+    "DAT:SOU": "CH1",
+    "DAT:STAR": "1",
+    "DAT:STOP": str(RECORD_LENGTH),
+    "DAT:WID": "1",
+    "MEASU:IMM:SOU": "CH1",
+    "MEASU:IMM:TYP": "PK2PK",
+    "CH1:VOL": "1.0E0",
+    "CH2:VOL": "5.0E-1",
+    "HOR:MAI:SCA": "5.0E-4",
+    "HEAD": "0",
+}
+
+MEASUREMENT_UNITS = {"PK2PK": "V", "MAXI": "V", "MINI": "V", "FREQ": "Hz", "PERI": "s"}
+
+
+def ShortMnemonic(node):
+    node = node.upper()
+
+    for short, long in MNEMONICS:
+        if node.startswith(short) and long.startswith(node):
+            return short
+
+    return node
+
+
+def SplitCommands(line):
+    # ';' separates commands unless it is inside a quoted string
+    commands = []
+    current = []
+    quoted = False
+
+    for character in line:
+        if character == '"':
+            quoted = not quoted
+        if character == ";" and not quoted:
+            commands.append("".join(current).strip())
+            current = []
+        else:
+            current.append(character)
+
+    commands.append("".join(current).strip())
+
+    return [command for command in commands if command]
+
+
+class TekSimulator:
+    # Software stand-in for a TDS scope on a pty, connect to it like to /dev/usbtmcN
+    def __init__(self, latency=0.0, transfer_rate=None, noise=0.02, seed=None):
+        self.latency = latency
+        self.transfer_rate = transfer_rate
+        self.noise = noise
+
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.events = []
+        self.queries = 0
+
+        self._random = np.random.default_rng(seed)
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self.port = None
+
+    def start(self):
+        self._master, self._slave = os.openpty()
+        # Binary blocks must go through untouched
+        tty.setraw(self._slave)
+
+        self.port = os.ttyname(self._slave)
+
+        self._thread = threading.Thread(target=self._serve, name="tek-simulator", daemon=True)
+        self._thread.start()
+
+        return self.port
+
+    def stop(self):
+        if self._master is None:
+            return
+
+        os.close(self._master)
+        os.close(self._slave)
+        self._master = None
+        self._slave = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _serve(self):
+        buffer = b""
+
+        while True:
+            try:
+                chunk = os.read(self._master, 65536)
+            except OSError:
+                return
+
+            if not chunk:
+                return
+
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                response = self.handle(line.decode("ascii", errors="replace"))
+
+                if response is None:
+                    continue
+
+                delay = self.latency
+                if self.transfer_rate:
+                    delay = delay + len(response) / self.transfer_rate
+                if delay > 0:
+                    time.sleep(delay)
+
+                try:
+                    os.write(self._master, response)
+                except OSError:
+                    return
+
+    def handle(self, line):
+        responses = []
+        path = []
+
+        for command in SplitCommands(line.strip()):
+            header, _, argument = command.partition(" ")
+
+            query = header.endswith("?")
+            header = header.rstrip("?")
+
+            if header.startswith("*"):
+                nodes = [header.upper()]
+            else:
+                if header.startswith(":"):
+                    path = []
+                    header = header[1:]
+
+                nodes = path + [ShortMnemonic(node) for node in header.split(":")]
+                path = nodes[:-1]
+
+            response = self.execute(nodes, argument.strip(), query)
+            if response is not None:
+                responses.append(response)
+
+        if not responses:
+            return None
+
+        # A binary block can only be the sole response, everything else is joined like the scope does
+        if len(responses) == 1 and isinstance(responses[0], bytes):
+            return responses[0] + b"\n"
+
+        return (";".join(str(response) for response in responses) + "\n").encode("ascii")
+
+    def execute(self, nodes, argument, query):
+        key = ":".join(nodes)
+
+        if query:
+            self.queries = self.queries + 1
+
+        if key in ("ID", "*IDN"):
+            return "ID TEK/TDS 1002,CF:91.1CT,FV:v2.12 TDS2CM:CMV:v1.04" if key == "ID" else "TEKTRONIX,TDS 1002,0,CF:91.1CT FV:v2.12 TDS2CM:CMV:v1.04"
+
+        if key == "*RST":
+            self.settings = dict(DEFAULT_SETTINGS)
+            return None
+
+        if key == "*ESR":
+            return "32" if self.events else "0"
+
+        if key == "ALLE":
+            events = self.events or ['0,"No events to report - queue empty"']
+            self.events = []
+            return ",".join(events)
+
+        if key == "CURV" and query:
+            return self.curve()
+
+        if key == "WFMP" and query:
+            return ";".join(str(value) for value in self.preamble().values())
+
+        if len(nodes) == 2 and nodes[0] == "WFMP" and query and nodes[1] in PREAMBLE_FIELDS:
+            return self.preamble()[nodes[1]]
+
+        if key == "MEASU:IMM:VAL" and query:
+            return f"{self.measure(self.settings['MEASU:IMM:SOU'], self.settings['MEASU:IMM:TYP']):.4E}"
+
+        if key == "MEASU:IMM:UNI" and query:
+            return f'"{MEASUREMENT_UNITS[self.settings["MEASU:IMM:TYP"]]}"'
+
+        if key in self.settings:
+            if query:
+                return self.settings[key]
+
+            if key in ("DAT:ENC", "DAT:SOU", "MEASU:IMM:SOU", "MEASU:IMM:TYP"):
+                argument = ShortMnemonic(argument)
+
+            self.settings[key] = argument
+            return None
+
+        self.events.append(f'113,"Undefined header; Command not found; {key}"')
+        return None
+
+    def channel_volts(self, source, time):
+        if source == "CH1":
+            volts = 2.0 * np.sin(2 * np.pi * 1e3 * time)
+        elif source == "CH2":
+            volts = np.where(np.sin(2 * np.pi * 1e3 * time + 0.5) >= 0, 1.5, -1.5)
+        elif source == "MATH":
+            # CH1 - CH2
+            volts = self.channel_volts("CH1", time) - self.channel_volts("CH2", time)
+        elif source == "REFA":
+            volts = 1.0 * np.sin(2 * np.pi * 2e3 * time)
+        else:
+            volts = 0.5 * self.channel_volts("CH2", time)
+
+        return volts
+
+    def data_range(self):
+        # Record points (1-based) sent by CURV?, clamped to the record
+        start = min(max(1, int(self.settings["DAT:STAR"])), RECORD_LENGTH)
+        stop = min(max(start, int(self.settings["DAT:STOP"])), RECORD_LENGTH)
+
+        return start, stop
+
+    def preamble(self):
+        source = self.settings["DAT:SOU"]
+        encoding = self.settings["DAT:ENC"]
+        width = int(self.settings["DAT:WID"])
+        start, stop = self.data_range()
+
+        # Math and reference waveforms keep the scale of CH1
+        volts_per_div = float(self.settings.get(f"{source}:VOL", self.settings["CH1:VOL"]))
+        seconds_per_div = float(self.settings["HOR:MAI:SCA"])
+        xincr = 10 * seconds_per_div / RECORD_LENGTH
+
+        unsigned = encoding in ("RPB", "SRP")
+
+        return {
+            "BYT_N": width,
+            "BIT_N": 8 * width,
+            "ENC": "ASC" if encoding == "ASCI" else "BIN",
+            "BN_F": "RP" if unsigned else "RI",
+            "BYT_O": "LSB" if encoding in ("SRI", "SRP") else "MSB",
+            # Like the instrument, the points of DAT:STAR to DAT:STOP with the trigger point (the middle of the
+            # record, at XZE) counted from DAT:STAR
+            "NR_P": stop - start + 1,
+            "WFI": f'"{source.capitalize()}, DC coupling, {volts_per_div:.1E} V/div, {seconds_per_div:.1E} s/div, {RECORD_LENGTH} points, Sample mode"',
+            "PT_F": "Y",
+            "XIN": f"{xincr:.4E}",
+            "PT_O": RECORD_LENGTH // 2 - (start - 1),
+            "XZE": "0.0E0",
+            "XUN": '"s"',
+            "YMU": f"{volts_per_div / LEVELS_PER_DIV / 256 ** (width - 1):.4E}",
+            "YZE": "0.0E0",
+            "YOF": f"{2 ** (8 * width - 1) if unsigned else 0:.4E}",
+            "YUN": '"Volts"',
+        }
+
+    def curve(self):
+        preamble = self.preamble()
+
+        source = self.settings["DAT:SOU"]
+        encoding = self.settings["DAT:ENC"]
+        width = int(self.settings["DAT:WID"])
+        indices = np.arange(int(preamble["NR_P"]))
+        time = float(preamble["XZE"]) + (indices - int(preamble["PT_O"])) * float(preamble["XIN"])
+
+        volts = self.channel_volts(source, time) + self._random.normal(0, self.noise, len(indices))
+
+        levels = np.clip(np.round(volts / float(preamble["YMU"])), -(2 ** (8 * width - 1)), 2 ** (8 * width - 1) - 1).astype(np.int64)
+        levels = levels + int(float(preamble["YOF"]))
+
+        if encoding == "ASCI":
+            return ",".join(str(level) for level in levels)
+
+        byteorder = "<" if encoding in ("SRI", "SRP") else ">"
+        kind = "u" if encoding in ("RPB", "SRP") else "i"
+        data = levels.astype(f"{byteorder}{kind}{width}").tobytes()
+
+        length = str(len(data))
+        return f"#{len(length)}{length}".encode("ascii") + data
+
+    def measure(self, source, type):
+        time = np.arange(RECORD_LENGTH) * 1e-6
+        volts = self.channel_volts(source, time)
+
+        if type == "PK2PK":
+            return volts.max() - volts.min()
+        if type == "MAXI":
+            return volts.max()
+        if type == "MINI":
+            return volts.min()
+        if type == "FREQ":
+            return 1e3
+
+        return 1e-3
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated TEK oscilloscope on a pty")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay before every response [s]")
+    parser.add_argument("--rate", type=float, default=None, help="Simulated transfer rate [bytes/s]")
+    args = parser.parse_args()
+
+    simulator = TekSimulator(latency=args.latency, transfer_rate=args.rate)
+    print(f"Simulated oscilloscope on {simulator.start()}, Ctrl+C to stop")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
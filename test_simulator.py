@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from oscilloscope import OscilloscopeSession, OscilloscopeSource, OscilloscopeChannel, OscilloscopeEncoding, OscilloscopeMeasurementType, OscilloscopeCurvesRaw, OscilloscopeMeasureTable, OSCILLOSCOPE_RECORD_LENGTH
+from recording import WaveformRecorder, WaveformRecording
+from tek_simulator import TekSimulator
+
+# Runs the drivers against the simulated instrument, test.py is the script for a real one
+
+
+@pytest.fixture(scope="module")
+def simulator():
+    simulator = TekSimulator(noise=0.0, seed=0)
+    simulator.start()
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture
+def ser(simulator):
+    commands = []
+    ser = OscilloscopeSession(simulator.port, log=lambda message, level: commands.append(message))
+    ser.commands = commands
+    ser.open()
+    yield ser
+    ser.close()
+
+
+@pytest.mark.parametrize("encoding", list(OscilloscopeEncoding))
+@pytest.mark.parametrize("width", [1, 2])
+@pytest.mark.parametrize("start, stop, stride", [(1, OSCILLOSCOPE_RECORD_LENGTH, 1), (501, 1500, 3)])
+def test_curves(simulator, ser, encoding, width, start, stop, stride):
+    sources = [OscilloscopeSource.CH1, OscilloscopeSource.CH2]
+    curves = OscilloscopeCurvesRaw(ser, sources, encoding, width, start, stop, stride)
+
+    assert len(curves) == len(sources)
+    for source, (points, preamble) in zip(sources, curves):
+        assert points.dtype.itemsize == width
+        assert len(points) == preamble.nr_pt == len(range(start, stop + 1, stride))
+        assert preamble.record_point(preamble.time[0]) == pytest.approx(start)
+
+        # Quantized to the vertical resolution of the width
+        expected = simulator.channel_volts(source.value, preamble.time)
+        assert np.abs(preamble.volts(points) - expected).max() <= preamble.ymult
+
+
+def test_measure_table_chunks(ser):
+    measurements = [(channel, type) for channel in OscilloscopeChannel for type in OscilloscopeMeasurementType]
+
+    whole = OscilloscopeMeasureTable(ser, measurements)
+    sent = len([command for command in ser.commands if command.startswith("-> MEASU")])
+
+    split = OscilloscopeMeasureTable(ser, measurements, max_command_length=60)
+    assert len([command for command in ser.commands if command.startswith("-> MEASU")]) - sent > 2
+
+    assert split == whole
+    assert [unit for _, unit in whole] == [{"FREQ": "Hz", "PERI": "s"}.get(type.value, "V") for _, type in measurements]
+
+
+def test_recording_round_trip(ser, tmp_path):
+    sources = [OscilloscopeSource.CH1, OscilloscopeSource.CH2]
+
+    captures = []
+    recorder = WaveformRecorder(str(tmp_path))
+    recorder.start()
+    for i in range(3):
+        curves = OscilloscopeCurvesRaw(ser, sources, OscilloscopeEncoding.RIBinary, 2, 101, 600, 2)
+        recorder.append(float(i), [(source.value, points, preamble) for source, (points, preamble) in zip(sources, curves)])
+        captures.append(curves)
+    recorder.stop()
+
+    assert recorder.error is None
+    assert (recorder.recorded, recorder.dropped) == (3, 0)
+
+    recording = WaveformRecording(str(tmp_path))
+    assert len(recording) == 3
+    assert recording.sources() == ["CH1", "CH2"]
+    assert list(recording.timestamps) == [0.0, 1.0, 2.0]
+
+    for source_index, source in enumerate(sources):
+        raw, indices = recording.raw(source.value)
+        assert list(indices) == [0, 1, 2]
+
+        points, preamble = captures[0][source_index]
+        assert np.array_equal(raw, np.stack([curves[source_index][0] for curves in captures]))
+        assert np.allclose(recording.volts(source.value), preamble.volts(raw))
+        assert np.allclose(recording.time(source.value), preamble.time)
+        assert recording.record(0)[source.value][1] == preamble
@@ -0,0 +1,132 @@
+import collections
+import numpy as np
+
+
+# Budget of the waveform histories of all owners together [bytes]
+WAVEFORM_STORE_MEMORY_LIMIT = 256 << 20
+
+
+class Waveform:
+    # One capture of one source, the raw samples stay in their native dtype and the time base
+    # belongs to the preamble, so every capture taken with the same preamble shares it
+    __slots__ = ("source", "raw", "preamble", "timestamp")
+
+    def __init__(self, source, raw, preamble, timestamp):
+        self.source = source
+        self.raw = raw
+        self.preamble = preamble
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_curve(cls, source, points, preamble, timestamp):
+        # Integers wider than the preamble width are narrowed to it, and every curve ends up in the host byte order
+        if points.dtype.kind == "i" and points.dtype.itemsize > preamble.byte_nr:
+            dtype = np.dtype(f"i{preamble.byte_nr}")
+        else:
+            dtype = points.dtype.newbyteorder("=")
+
+        return cls(source, np.ascontiguousarray(points, dtype=dtype), preamble, timestamp)
+
+    def __len__(self):
+        return len(self.raw)
+
+    @property
+    def nbytes(self):
+        return self.raw.nbytes
+
+    @property
+    def time(self):
+        return self.preamble.time[:len(self.raw)]
+
+    def volts(self):
+        return self.preamble.volts(self.raw)
+
+    def volts_range(self):
+        # Volts of the lowest and highest sample the dtype can hold, the whole digitizer range
+        limits = np.iinfo(self.raw.dtype)
+        low, high = self.preamble.volts(np.array([limits.min, limits.max], dtype=np.float64))
+
+        return min(low, high), max(low, high)
+
+
+class WaveformStore:
+    # Latest waveform of every source of each owner, plus an optional history of captures per owner.
+    # Histories are trimmed to their length and, once all of them exceed memory_limit, the least recently
+    # used owner loses its oldest capture first
+    def __init__(self, memory_limit=WAVEFORM_STORE_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.nbytes = 0
+        self.evicted = 0
+
+        self._latest = {}
+        # owner -> deque of captures (lists of Waveform), least recently used owner first
+        self._histories = collections.OrderedDict()
+
+    def add(self, owner, waveforms, history_length=0):
+        latest = self._latest.setdefault(owner, {})
+        for waveform in waveforms:
+            latest[waveform.source] = waveform
+
+        history = self._histories.setdefault(owner, collections.deque())
+        self._histories.move_to_end(owner)
+
+        if history_length > 0:
+            history.append(list(waveforms))
+            self.nbytes = self.nbytes + sum(waveform.nbytes for waveform in waveforms)
+
+        while len(history) > max(history_length, 0):
+            self._pop(owner)
+
+        self.evict()
+
+    def latest(self, owner, source):
+        return self._latest.get(owner, {}).get(source)
+
+    def history(self, owner, source=None):
+        # Oldest first, every capture if source is None
+        history = self._histories.get(owner)
+        if history is None:
+            return []
+
+        self._histories.move_to_end(owner)
+
+        if source is None:
+            return list(history)
+
+        return [waveform for capture in history for waveform in capture if waveform.source == source]
+
+    def history_volts(self, owner, source):
+        # (captures, points) volts of the history captures that share the time base of the latest waveform
+        latest = self.latest(owner, source)
+        if latest is None:
+            return np.zeros(0), np.zeros((0, 0))
+
+        time_base = (len(latest), latest.preamble.xincr, latest.preamble.xzero, latest.preamble.pt_off)
+        waveforms = [waveform for waveform in self.history(owner, source) if (len(waveform), waveform.preamble.xincr, waveform.preamble.xzero, waveform.preamble.pt_off) == time_base]
+        if not waveforms:
+            return latest.time, np.zeros((0, len(latest)))
+
+        scales = np.array([(waveform.preamble.ymult, waveform.preamble.yoff, waveform.preamble.yzero) for waveform in waveforms])
+        ymult, yoff, yzero = scales[:, 0:1], scales[:, 1:2], scales[:, 2:3]
+
+        return latest.time, (np.stack([waveform.raw for waveform in waveforms]) - yoff) * ymult + yzero
+
+    def history_size(self, owner):
+        return len(self._histories.get(owner, ()))
+
+    def clear_history(self, owner):
+        while self.history_size(owner):
+            self._pop(owner)
+
+    def evict(self):
+        for owner, history in self._histories.items():
+            while history and self.nbytes > self.memory_limit:
+                self._pop(owner)
+                self.evicted = self.evicted + 1
+
+            if self.nbytes <= self.memory_limit:
+                break
+
+    def _pop(self, owner):
+        capture = self._histories[owner].popleft()
+        self.nbytes = self.nbytes - sum(waveform.nbytes for waveform in capture)